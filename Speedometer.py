@@ -1,9 +1,11 @@
 #
 # Created by Lithops on 2020/10/27.
 #
+from __future__ import annotations
+
 import bisect
+import threading
 import time
-from tkinter import Tk, Label, Button
 from typing import Dict, Callable, List, Optional
 
 
@@ -164,165 +166,84 @@ class Stopwatch:
 
 class Speedometer:
     """
-    all time values are in ms
+    all time values are in ms.
+    values are summed into time buckets of precision ms, kept in a ring buffer that covers horizon ms: each slot holds
+    the cumulative value at the end of its bucket, so submit and cur_speed are O(1) and memory is constant however
+    long it runs. values older than the horizon are forgotten, except in their sum.
     """
-    class _TimeKey:  # do not mix this class with int as keys of one dict.
-
-        def __init__(self, timestamp_ms: int, precision_ms: int):
-            self.timestamp = timestamp_ms
-            self.precision = precision_ms
-            self.st_interval = _get_st_interval(self.timestamp, self.precision)
-
-        def __eq__(self, other):
-            if isinstance(other, Speedometer._TimeKey):
-                return self.st_interval == other.st_interval
-            elif isinstance(other, int):
-                return self.st_interval == _get_st_interval(other, self.precision)
-            return False
-
-        def __hash__(self):
-            return hash(self.st_interval)
 
-        def __repr__(self):
-            return f'TimeKey(ts={self.timestamp}, p={self.precision}, st={self.st_interval})'
-
-        def __lt__(self, other):
-            if isinstance(other, Speedometer._TimeKey):
-                return self.st_interval < other.st_interval
-            elif isinstance(other, int):
-                return self.st_interval < _get_st_interval(other, self.precision)
-            raise TypeError
-
-        def __gt__(self, other):
-            if isinstance(other, Speedometer._TimeKey):
-                return self.st_interval > other.st_interval
-            elif isinstance(other, int):
-                return self.st_interval > _get_st_interval(other, self.precision)
-            raise TypeError
-
-    def __init__(self, precision_ms=100, start_now=True):
+    def __init__(self, precision_ms=100, start_now=True, horizon_ms=60000):
         self.precision = precision_ms
-        self._records: Dict[Speedometer._TimeKey, int] = {}  # suffix array
-        self._sorted_keys = []
+        self.horizon = horizon_ms
+        self._n = max(horizon_ms // precision_ms, 1) + 1  # number of buckets kept
+        self._cums = [0] * self._n  # slot bucket % n: cumulative value at the end of that bucket
+        self._first = None  # first bucket ever submitted to
+        self._last = None  # latest bucket submitted to
+        self._total = 0  # cumulative value at the end of the latest bucket
         self.stopwatch = Stopwatch(start_now=start_now)
 
-    def _find_k_lt(self, timestamp):
-        return self._sorted_keys[_find_i_lt(self._sorted_keys, timestamp)]
-
-    def _find_v_lt(self, timestamp, earliest_v=None):
-        try:
-            return self._records[self._find_k_lt(timestamp)]
-        except ValueError:
-            if earliest_v is not None:
-                return earliest_v
-            raise
-
-    def _find_k_gt(self, timestamp):
-        return self._sorted_keys[_find_i_gt(self._sorted_keys, timestamp)]
-
-    def _find_v_gt(self, timestamp, latest_v=None):
-        try:
-            return self._records[self._find_k_gt(timestamp)]
-        except ValueError:
-            if latest_v is not None:
-                return latest_v
-            raise
-
-    def _find_k_le(self, timestamp):
-        return self._sorted_keys[_find_i_le(self._sorted_keys, timestamp)]
-
-    def _find_v_le(self, timestamp, earliest_v=None):
-        try:
-            return self._records[self._find_k_le(timestamp)]
-        except ValueError:
-            if earliest_v is not None:
-                return earliest_v
-            raise
-
-    def _find_k_ge(self, timestamp):
-        return self._sorted_keys[_find_i_ge(self._sorted_keys, timestamp)]
-
-    def _find_v_ge(self, timestamp, latest_v=None):
-        try:
-            return self._records[self._find_k_ge(timestamp)]
-        except ValueError:
-            return latest_v
-
-    def _gen_all_k_gt(self, timestamp):
+    def _advance(self, bucket):
         """
-        O(nlogn)
+        make bucket the latest one, carrying the total over the buckets nobody has submitted to. amortised O(1).
         """
-        while True:
-            try:
-                yield (timestamp := self._find_k_gt(timestamp))
-            except ValueError:
-                break
+        if self._last is None:
+            self._first = bucket
+        else:
+            for b in range(max(self._last + 1, bucket - self._n + 1), bucket):
+                self._cums[b % self._n] = self._total
+        self._last = bucket
 
-    def _gen_all_k_gt_2(self, timestamp):
+    def _cum_at(self, bucket):
         """
-        O(n)
+        O(1)
+        :return: cumulative value at the end of bucket, as far as it is still known.
         """
-        try:
-            initial_i = _find_i_gt(self._sorted_keys, timestamp)
-        except ValueError:
-            return
-        for i in range(initial_i, len(self._sorted_keys)):
-            yield self._sorted_keys[i]
+        if self._last is None or bucket < self._first:
+            return 0
+        if bucket >= self._last:
+            return self._total
+        oldest = self._last - self._n + 1
+        return self._cums[max(bucket, oldest) % self._n]
 
     def submit(self, value, timestamp=None, cumulative=False):
         """
         :param value: value to be submitted.
-        :param timestamp: for debug use only.
+        :param timestamp: for debug use only. one earlier than the horizon is ignored.
         :param cumulative: if set to True, assume that the provided value is accumulated from the previous record.
         :return: True if the given value is inserted,
         False if the given value overwrote a previously inserted record.
         """
-
-        if timestamp is None:  # O(1)? if timestamp not specified and insert to the end
+        if timestamp is None:  # O(1)
             timestamp = _get_time_ms()
-            if not self.stopwatch.is_started_at(timestamp):
-                raise ValueError('submitting value when Speedometer is paused is disallowed.')
-            k = Speedometer._TimeKey(timestamp, self.precision)
-            is_overwritten = timestamp in self._records
-            if not cumulative:
-                if is_overwritten:
-                    self._records[k] += value
-                else:
-                    prev_v = list(self._records.values())[-1] if len(self._records) > 0 else 0
-                    self._records[k] = prev_v + value
-            else:
-                self._records[k] = value
-
-            self._sorted_keys.append(k)
-
-        else:  # O(logn) ? if timestamp specified and insertion point may not be the end
-            if not self.stopwatch.is_started_at(timestamp):
+            if self.stopwatch.status != Stopwatch.STARTED:
                 raise ValueError('submitting value when Speedometer is paused is disallowed.')
-            k = Speedometer._TimeKey(timestamp, self.precision)
-            is_overwritten = timestamp in self._records
-            if not cumulative:
-                if is_overwritten:
-                    self._records[k] += value
-                else:
-                    prev_v = self._find_v_lt(timestamp, 0)
-                    self._records[k] = prev_v + value
-            else:
-                self._records[k] = value
-
-            # update sorted_keys
-            self._sorted_keys.append(k)
-            self._sorted_keys = sorted(self._sorted_keys)
-
-            # update all later values if submitted timestamp is not the last.
-            for k in self._gen_all_k_gt_2(timestamp):
-                self._records[k] += value
+        elif not self.stopwatch.is_started_at(timestamp):
+            raise ValueError('submitting value when Speedometer is paused is disallowed.')
+        return self._add(value, timestamp, cumulative)
 
+    def _add(self, value, timestamp, cumulative=False):
+        bucket = timestamp // self.precision
+
+        if self._last is None or bucket > self._last:
+            self._advance(bucket)
+            is_overwritten = False
+        else:
+            is_overwritten = bucket >= self._first
+            if bucket <= self._last - self._n:
+                return is_overwritten
+        if cumulative:
+            value -= self._cum_at(bucket)
+        if bucket < self._first:
+            self._first = bucket
+        # O(horizon / precision) if the bucket is not the latest one: all later cumulative values include it.
+        for b in range(max(bucket, self._last - self._n + 1), self._last):
+            self._cums[b % self._n] += value
+        self._total += value
+        self._cums[self._last % self._n] = self._total
         return is_overwritten
 
     def _get_value_between(self, timestamp_l, timestamp_u):
-        vl = self._find_v_le(timestamp_l, 0)
-        vu = self._find_v_le(timestamp_u, 0)
-        return vu - vl
+        return self._cum_at(timestamp_u // self.precision) - self._cum_at(timestamp_l // self.precision)
 
     def cur_speed(self, instant_ms=None, formatter: Optional[Callable[[float], str]] = None):
         if instant_ms is None:
@@ -330,7 +251,8 @@ class Speedometer:
         cur_time = _get_time_ms()
         delta_v = self._get_value_between(cur_time - instant_ms, cur_time)
         lapsed_time = self.stopwatch.get_lapsed(cur_time - instant_ms, cur_time, no_error=True)
-        return formatter(delta_v / lapsed_time) if formatter is not None else delta_v / lapsed_time
+        speed = delta_v / lapsed_time if lapsed_time > 0 else 0  # e.g. started within this ms
+        return formatter(speed) if formatter is not None else speed
 
     def overall_speed(self, formatter: Optional[Callable[[float], str]] = None):
         """
@@ -338,8 +260,7 @@ class Speedometer:
         :param formatter:
         :return: in v/ms
         """
-        cur_time = _get_time_ms()
-        delta_v = self._get_value_between(0, cur_time)
+        delta_v = self._total
         lapsed_time = self.stopwatch.total_lapsed()  # todo
         return formatter(delta_v / lapsed_time) if formatter is not None else delta_v / lapsed_time
 
@@ -350,7 +271,69 @@ class Speedometer:
         self.stopwatch.start()
 
     def __repr__(self):
-        return 'Speedometer:' + repr(self._records)
+        if self._last is None:
+            return 'Speedometer:{}'
+        buckets = range(max(self._first, self._last - self._n + 1), self._last + 1)
+        return 'Speedometer:' + repr({b * self.precision: self._cum_at(b) for b in buckets})
+
+
+class SpeedAggregator(Speedometer):
+    """
+    a Speedometer that any number of threads submit to, and that passes every submission on to its parent, e.g.
+    download -> host -> process. so reading the speed of any level is O(1), however many threads are below it.
+    it cannot be paused; values are in v/ms like those of Speedometer.
+    """
+
+    def __init__(self, parent: Optional[SpeedAggregator] = None, precision_ms=100, horizon_ms=60000):
+        super().__init__(precision_ms, True, horizon_ms)
+        self.parent = parent
+        self._lock = threading.Lock()
+        self._children: Dict[str, SpeedAggregator] = {}
+
+    def child(self, key):
+        """
+        :return: the aggregator under this one for key (e.g. a host), created on first use. it lives as long as this
+        one, so keys should be few; a short-lived level (e.g. a download) is made with SpeedAggregator(parent) instead.
+        """
+        with self._lock:
+            node = self._children.get(key)
+            if node is None:
+                node = self._children[key] = SpeedAggregator(self, self.precision, self.horizon)
+            return node
+
+    def children(self):
+        with self._lock:
+            return dict(self._children)
+
+    def submit(self, value, timestamp=None, cumulative=False):
+        """
+        O(depth)
+        """
+        if cumulative:
+            raise ValueError('cumulative values cannot be passed on to a parent.')
+        if timestamp is None:
+            timestamp = _get_time_ms()
+        node = self
+        while node is not None:
+            with node._lock:
+                node._add(value, timestamp)
+            node = node.parent
+
+    def total(self):
+        return self._total
+
+    def _get_value_between(self, timestamp_l, timestamp_u):
+        with self._lock:
+            return super()._get_value_between(timestamp_l, timestamp_u)
+
+    def pause(self):
+        raise RuntimeError('SpeedAggregator cannot be paused.')
+
+    def start(self):
+        raise RuntimeError('SpeedAggregator cannot be paused.')
+
+
+process_speed = SpeedAggregator()  # all downloads of the process, with a child per host
 
 
 # 11003 True
@@ -377,20 +360,16 @@ class Speedometer:
 # # 40 2300
 # while True:
 #     st = int(input())
-#     for i in sm._gen_all_k_gt(st):
-#         print(i)
-#     print('###########')
-#     for i in sm._gen_all_k_gt_2(st):
-#         print(i)
-#     print()
+#     print(sm._get_value_between(0, st))
 
-import threading
 from utils import _fmt_size
 from random import randint
 from time import sleep
 
 
 def test1():
+    from tkinter import Tk, Label, Button
+
     def sp_fmt(sp):
         return _fmt_size(sp * 1000) + '/s'
 
@@ -445,15 +424,12 @@ def test1_1():
     # 40 2300
     while True:
         st = int(input())
-        for i in sm._gen_all_k_gt(st):
-            print(i)
-        print('###########')
-        for i in sm._gen_all_k_gt_2(st):
-            print(i)
-        print()
+        print(sm._get_value_between(0, st))
 
 
 def test2():
+    from tkinter import Tk, Label, Button
+
     root = Tk()
     sw = Stopwatch(True)
     lbl_lapsed = Label(root)
@@ -5,252 +5,649 @@
 
 import logging
 import os
-import shutil
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from http.client import HTTPException
+from bisect import insort
 from math import ceil
-from os import listdir, makedirs
-from os.path import join, exists, split
-from random import randint, choice
-from time import sleep, time
-from typing import Optional
+from os import makedirs
+from os.path import join, split
+from time import sleep, time, monotonic
+from typing import Optional, List, Dict
+from urllib.parse import urlsplit
 
 import requests
-
-from interface import Interface
+from urllib3.exceptions import HTTPError as _Urllib3Error
+
+import metrics
+import tracing
+from connpool import session_pool
+from observer import ProgressObserver, CallbackObserver
+from ratelimit import TokenBucket, Lease, global_limiter
+from segments import Segment, SegmentMap, SPLIT_POLICIES
+from Speedometer import SpeedAggregator, process_speed
+from storage import DebrisStorage, DirectStorage
+from tuning import AutoTuner, ConnectionController
 from utils import *
 
 script_folder = split(__file__)[0]
 
-logging.basicConfig(filename=join(script_folder, 'logging_info.txt'),
-                    level=logging.DEBUG,
-                    filemode='w',
-                    format='%(module)-12s line=%(lineno)-5d %(levelname)-7s %(asctime)-10s %(message)s',
-                    datefmt='%H:%M:%S')
-
-# disable all other loggers - workaround that avoids requests module from writing to my logger file, finding which wasted a lot of my time.
-for name in logging.root.manager.loggerDict:
-    logging.getLogger(name).disabled = True
-
+# silent unless the application configures logging, or calls enable_logging. nothing else is touched at import.
 _logger = logging.getLogger('hsrequest_logger')
-
-_mutex = threading.Lock()
+_logger.addHandler(logging.NullHandler())
+
+
+def enable_logging(filename=None, level=logging.DEBUG):
+    """
+    write the log of hsrequest, and only that, to a file: by default logging_info.txt beside this script, overwritten.
+    other loggers and the root logger are left as they are.
+    :return: the handler added, to be removed from logging.getLogger('hsrequest_logger') to stop.
+    """
+    handler = logging.FileHandler(filename or join(script_folder, 'logging_info.txt'), mode='w')
+    handler.setFormatter(logging.Formatter('%(module)-12s line=%(lineno)-5d %(levelname)-7s %(asctime)-10s %(message)s',
+                                           datefmt='%H:%M:%S'))
+    _logger.addHandler(handler)
+    _logger.setLevel(level)
+    _logger.propagate = False  # as before: the log goes to the file, not to the handlers of the application
+    return handler
 
 _local = threading.local()  # place to put thread-local data (i.e. private data owned by a single thread)
 
 
-# [[start,end,ongoing],[start,end,ongoing]...]
-# meaning: [start,end) has downloaded;
-# ongoing==True: end may extend (download process for this chunk has not finished. Other threads should not start straight at end.
-# ongoing==False: end will no longer extend (download process for this chunk has finished. Feel free to start right at end.
-class _Progress(list):
-    def ins(self, a):
-        for i in range(len(self)):
-            if a[0] < self[i][0]:
-                self.insert(i, a)
-                return
-        self.insert(len(self), a)
-
-    def get_next(self, a):
-        return self[self.index(a) + 1]
-
-    # find another point to start that has the biggest undownloaded span after thread finishes downloading
-    # return -1: Stand by; -2: All finished; other non-neg values: pos to insert at.
-    def find_insert_pt(self):
-        code = -2
-        pos = []
-        for i in range(len(self) - 1):
-            span = self[i + 1][0] - self[i][1]
-            if code == -2 and span > 0:
-                code = -1
-            if self[i][2] and span > min_insertion_interval:
-                pos.append((self[i + 1][0] + self[i][1]) // 2)
-            elif not self[i][2] and span > 0:
-                pos.append(self[i][1])
-        print(pos)
-        return choice(pos) if len(pos) != 0 else code
-
-
 chunk_size = 40960  # size of each retrieval of data, in bytes
 min_insertion_interval = 4096000  # minimum interval of undownloaded data that allows a thread to start downloading from, in bytes
 # ^making this value too small leads to large volume of requests and too many debris files,
 # thus taking more time for downloading & combining.
-_progress = _Progress()
+# both are only the starting points of a download that auto-tunes them (see tuning.AutoTuner).
+tune_every = 32  # reads between two throughput measurements of a thread when auto-tuning
+control_interval = 1  # seconds between two throughput samples of an adaptive download
 temp_dir = join(script_folder, 'temp_debris_st')  # directory to store all debris files
-
-interface: Optional[Interface] = None
-
-def _download_thread(debris_dir, url, size, start, no, headers, timeout, **kwargs):
-    if start == -1:
-        interface.submit_status(str(no), "Stand by.")
-        interface.finalise(str(no))
-        _logger.debug(f'thread {no}: Stand by.')
-        if _mutex.locked():  # after some tests, this condition seems to be always true.
-            _mutex.release()
-        sleep(1)
-    elif start == -2:
-        interface.submit_status(str(no), "Execution over.")
-        interface.finalise(str(no))
-        _logger.debug(f'thread {no}: EXECUTION OVER.')
-        if _mutex.locked():  # after some tests, this condition seems to be always true.
-            _mutex.release()
-        if hasattr(_local, 'session'):
-            _local.session.close()
-        return
+journal_interval = 5  # seconds between two periodic writes of the resume journal
+
+
+def _default_sizes():
+    return chunk_size, min_insertion_interval
+
+
+def _download_speed(url):
+    """
+    :return: a new speed aggregator for a download of url, under the one of its host in process_speed.
+    """
+    return SpeedAggregator(process_speed.child(urlsplit(url).netloc))
+
+
+class _Download:
+    """
+    state of one download, shared by its worker threads.
+    segments are handed out by next_segment: first from a work queue of the initial even split (see reserve), then from
+    progress.find_insert_pt. a worker with nothing to do waits on cond, and is woken as soon as any segment
+    ends, since that may open a gap to start from.
+    if journal_key is given, the downloaded ranges are saved to the journal of storage under it, so that a later run
+    can resume them.
+    chunk_size and min_insertion_interval are fixed if given, otherwise auto-tuned from what the threads measure.
+    limiter caps the bandwidth of this download, on top of ratelimit.global_limiter.
+    response: the streamed response of the pre-check, from offset 0. the segment starting at 0 reads its body instead
+    of sending the same request again.
+    speed: receives what each thread reads, once per bucket of the speed (or tune_every reads), and passes it on to the
+    speed of its host and process (see _download_speed).
+    """
+
+    def __init__(self, url, size, headers, timeout, storage, observer, kwargs, split_policy=None, cond=None,
+                 journal_key=None, chunk_size=None, min_insertion_interval=None, limiter: Optional[TokenBucket] = None,
+                 session: Optional[requests.Session] = None, response: Optional[requests.Response] = None,
+                 speed: Optional[SpeedAggregator] = None):
+        self.url = url
+        self.host = urlsplit(url).netloc
+        self.size = size
+        self.headers = headers
+        self.timeout = timeout
+        self.storage = storage
+        self.observer = observer
+        self.kwargs = kwargs
+        self.split_policy = split_policy
+
+        self.progress = SegmentMap()
+        self.progress.ins(Segment(size, size, False))
+        self.progress.ins(Segment(0, 0, False))
+        # guards progress and queue. may be shared by many downloads (see DownloadManager).
+        self.cond = threading.Condition(threading.Lock()) if cond is None else cond
+        self.queue = deque()
+        self.journal_key = journal_key
+        self.journal_lock = threading.Lock()  # serialises journal writes; never taken inside cond
+
+        self.fixed_chunk_size = chunk_size
+        self.fixed_min_insertion_interval = min_insertion_interval
+        self.tuner = None
+        if chunk_size is None or min_insertion_interval is None:
+            self.tuner = AutoTuner(*_default_sizes())
+        self.chunk_size = chunk_size or self.tuner.chunk_size
+        self.min_insertion_interval = min_insertion_interval or self.tuner.min_insertion_interval
+        self.max_chunk_size = self.chunk_size  # largest chunk any thread may be reading
+        self.finished = threading.Event()  # set once nothing is left to download, or the download has failed
+        self.error: Optional[Exception] = None  # set by fail
+        self.limiter = limiter
+        self.session = session_pool.session(url) if session is None else session
+        self.response = response
+        self.speed = _download_speed(url) if speed is None else speed
+
+    def observe_ttfb(self, t):
+        self.tuner.observe_ttfb(t)
+        self._publish_sizes()
+
+    def observe_speed(self, speed):
+        """
+        :return: the chunk_size to read with from now on.
+        """
+        self.tuner.observe_speed(speed)
+        return self._publish_sizes()
+
+    def _publish_sizes(self):
+        # a split keeps min_insertion_interval // 2 away from the owner, which must not be less than a chunk being
+        # read (see Segment.stop_at). so the interval is raised before any thread reads with a larger chunk.
+        with self.cond:
+            size = self.fixed_chunk_size or self.tuner.chunk_size
+            if self.fixed_min_insertion_interval is not None:
+                size = min(size, max(self.fixed_min_insertion_interval // 2, 1))
+            self.max_chunk_size = max(self.max_chunk_size, size)
+            self.chunk_size = size
+            self.min_insertion_interval = (self.fixed_min_insertion_interval or
+                                           max(self.tuner.min_insertion_interval, 2 * self.max_chunk_size))
+            return size
+
+    def resume(self, done):
+        """
+        mark the ranges [(start, end), ...] downloaded by an earlier run as finished segments.
+        """
+        with self.cond:
+            for start, end in done:
+                self.progress.ins(Segment(start, end, False))
+        if any(start == 0 for start, _ in done):  # no segment will start at 0 again
+            self.drop_response()
+
+    def take_response(self, start):
+        """
+        :return: the pre-check response if a segment starting at start can read it, else None. it is handed out once.
+        """
+        if start != 0 or self.response is None:
+            return None
+        with self.cond:
+            html, self.response = self.response, None
+        return html
+
+    def drop_response(self):
+        html = self.take_response(0)
+        if html is not None:
+            _release(html)
+
+    def save_journal(self):
+        with self.cond:
+            done = [(seg.start, seg.end) for seg in self.progress if seg.end > seg.start]
+        with self.journal_lock:
+            if self.journal_key is None:
+                return
+            try:
+                self.storage.save(self.journal_key, done)
+            except OSError as e:  # the download goes on; only the resume point is older
+                _logger.error(f'failed to save journal: {e}')
+
+    def close_journal(self):
+        """
+        stop saving the journal, before storage is finished.
+        """
+        with self.journal_lock:
+            self.journal_key = None
+
+    def reserve(self, starts):
+        """
+        queue the segments starting at starts, each inserted into progress at once, empty and ongoing. so every segment
+        stops at the next start from its first byte on, e.g. the one reading the pre-check response before any other
+        thread has claimed its start. cond must be held.
+        """
+        for pos in starts:
+            seg = Segment(pos, pos, True)
+            self.progress.ins(seg)
+            self.queue.append(seg)
+
+    def claim(self):
+        """
+        claim a new segment without waiting. cond must be held.
+        :return: the new ongoing Segment, or -1 (Stand by), or -2 (All finished).
+        """
+        if self.error is not None:
+            return -1
+        if self.queue:
+            return self.queue.popleft()
+        while True:
+            with tracing.span('split') as span:
+                pos = self.progress.find_insert_pt(self.min_insertion_interval, self.split_policy)
+                span.set(pos=pos)
+            if pos < 0:
+                return pos
+            seg = Segment(pos, pos, True)
+            self.progress.ins(seg)
+            # the owner of the gap reads on without the lock. if it got within a chunk of pos while pos was being
+            # found (e.g. this thread lost the GIL), its next write may already pass pos: find another point.
+            prev = self.progress.get_prev(seg)
+            if prev is None or not prev.ongoing or prev.end + self.max_chunk_size <= pos:
+                break
+            self.progress.remove(seg)
+        metrics.splits.labels(self.host).inc()
+        return seg
+
+    def next_segment(self, label, worker=None):
+        """
+        block until a new segment is claimed, or all is finished, or the download has failed, or worker is retired.
+        :return: the new ongoing Segment, or None if the thread should exit.
+        """
+        with self.cond:
+            while True:
+                if self.error is not None or worker is not None and worker.retired:
+                    return None
+                seg = self.claim()
+                if seg == -2:
+                    self.finished.set()
+                    return None
+                if seg != -1:
+                    return seg
+                self.observer.submit_status(label, "Stand by.")
+                self.observer.finalise(label)
+                _logger.debug(f'thread {label}: Stand by.')
+                t = monotonic()
+                self.cond.wait()
+                metrics.standby_seconds.labels(self.host).inc(monotonic() - t)
+
+    def fail(self, error):
+        """
+        end the download with error, e.g. raised by the observer or the storage: no segment is handed out any more, and
+        the other threads leave theirs at their next chunk.
+        """
+        with self.cond:
+            if self.error is None:
+                self.error = error
+            self.finished.set()
+            self.cond.notify_all()
+
+    def end_segment(self, seg):
+        with self.cond:
+            seg.ongoing = False
+            if seg.start == seg.end:  # if nothing is downloaded, remove entry from progress (otherwise it causes a bug - see log)
+                self.progress.remove(seg)
+            self.cond.notify_all()
+
+
+def _receive_buffer(size):
+    """
+    :return: a memoryview of at least size bytes, owned by this thread and reused by all of its segments.
+    """
+    buf = getattr(_local, 'buffer', None)
+    if buf is None or len(buf) < size:
+        buf = _local.buffer = memoryview(bytearray(size))
+    return buf
+
+
+def _raw_readinto(html: requests.Response):
+    """
+    :return: readinto of the http.client response under urllib3, which fills a given buffer straight from the socket
+    buffer; or None if the body is encoded (its bytes must go through urllib3's decoder) or there is no such response.
+    """
+    if html.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None
+    return getattr(getattr(html.raw, '_fp', None), 'readinto', None)
+
+
+class _Worker:
+    """
+    a thread of an adaptive download. received is only written by the thread itself, retired only by the controller.
+    """
+
+    def __init__(self, no):
+        self.no = no
+        self.received = 0
+        self.retired = False
+        self.thread: Optional[threading.Thread] = None
+
+
+def _release(html: requests.Response):
+    """
+    give the connection of html back to its pool: as it is if the body has been read to its end, closed otherwise.
+    """
+    raw = html.raw
+    fp = getattr(raw, '_fp', None)
+    if fp is None or not getattr(fp, 'isclosed', lambda: False)():
+        raw.close()
+    raw.release_conn()
+
+
+def _download_segment(download: _Download, download_range: Segment, no, worker: Optional[_Worker] = None):
+    """
+    download from download_range.start until its stop_at, or until the connection fails, or worker is retired.
+    :return: True if the download was interrupted by an error.
+    """
+    connections = metrics.active_connections.labels(download.host)
+    connections.inc()
+    try:
+        with tracing.span('segment', start=download_range.start) as span:
+            failed = _receive_segment(download, download_range, no, worker)
+            span.set(end=download_range.end, failed=failed)
+    finally:
+        connections.dec()
+    if failed:
+        metrics.retries.labels(download.host).inc()
+    return failed
+
+
+def _receive_segment(download: _Download, download_range: Segment, no, worker: Optional[_Worker] = None):
+    observer = download.observer
+    start = download_range.start
+
+    headers_copy = dict(download.headers)
+    headers_copy['Range'] = f'bytes={start}-'
+
+    _logger.debug(f'thread {no}: {start}- sending request...')
+
+    tuner = download.tuner
+    html = download.take_response(start)
+    if html is not None:
+        _logger.debug(f'thread {no}: reading the pre-check response.')
+        t = html.elapsed.total_seconds()  # from sending the pre-check to its headers, as t below
     else:
-        download_range = [start, start, True]
-        _progress.ins(download_range)
-        if _mutex.locked():
-            _mutex.release()  # mark has set. release. be careful the lock should be released only when this function is recursively called.
-
-        if not hasattr(_local, 'session'):
-            session = requests.Session()
-            _local.session = session
-        else:
-            session = _local.session
-
-        debris_path = join(debris_dir, f'{start}')
-
-        headers_copy = dict(headers)
-        headers_copy['Range'] = f'bytes={start}-'
-
-        _logger.debug(f'thread {no}: {start}- sending request...')
-
         try:
-            interface.submit_status(str(no), 'Sending request...')
-            html = session.request(url=url, headers=headers_copy, timeout=timeout, stream=True, **kwargs)
-            it = html.iter_content(chunk_size=chunk_size)
+            observer.submit_status(str(no), 'Sending request...')
+            t_request = monotonic()
+            with tracing.span('request', 'http'):
+                html = download.session.request(url=download.url, headers=headers_copy, timeout=download.timeout,
+                                                stream=True, **download.kwargs)
             if not _is_status_code_valid(html.status_code):
+                _release(html)
                 raise requests.RequestException(f'invalid response code = {html.status_code}.')
         except requests.RequestException as e:
-            interface.submit_status(str(no), 'Get response failed')
-            sleep(2)
+            observer.submit_status(str(no), 'Get response failed')
             _logger.error(f'thread {no}: failed to get response: {e}')
+            return True
+        t = monotonic() - t_request
+    metrics.ttfb.labels(download.host).observe(t)
+    if tuner is not None:
+        download.observe_ttfb(t)
+
+    _logger.debug(f'thread {no}: request success. response code = {html.status_code}')
+    # _logger.debug(f'thread {no}: cookies = {session.cookies.get_dict()}')
+    observer.submit_status(str(no), 'Retrieving...')
+    observer.start(str(no), start)
+    download_range.t_start = t_mark = monotonic()
+
+    # read straight from urllib3 rather than iter_content, so that the chunk size can be retuned between two reads.
+    # if possible, read into this thread's buffer and write from a view of it: no bytes object per chunk at all.
+    raw = html.raw
+    readinto = _raw_readinto(html)
+    size = download.chunk_size
+    buf = _receive_buffer(size) if readinto is not None else None
+    # bound once: without tracing, these are the plain methods.
+    read = tracing.traced(readinto or raw.read, 'read', 'http')
+    reads, mark = 0, start
+    received, reported = metrics.bytes_received.labels(download.host, no), start
+    # the speed and the metric are fed once per bucket of the speed, or after tune_every reads if that comes first.
+    flush_every = download.speed.precision / 1000
+    flush_at, flushed = monotonic() + flush_every, 0
+    lease = Lease((download.limiter, global_limiter))
+    try:
+        with download.storage.open_segment(start) as f, tracing.span('receive'):
+            write = tracing.traced(f.write, 'write', 'disk')
+            while True:
+                try:
+                    if readinto is not None:
+                        data = buf[:read(buf[:size])]
+                        if not data:
+                            raise EOFError('connection closed before the segment ended.')
+                    else:
+                        data = read(size, decode_content=True)
+                        if not data and raw.closed:
+                            raise EOFError('connection closed before the segment ended.')
+                except (_Urllib3Error, HTTPException, OSError, EOFError) as e:
+                    _logger.error(f'thread {no}: failed to get data: {e}')
+                    observer.submit_status(str(no), 'Get data failed')
+                    return True
+                reads += 1
+                now = monotonic()
+                if now >= flush_at or reads - flushed >= tune_every:
+                    # not per chunk: the metric and every level of the speed have locks shared with other threads
+                    received.inc(download_range.end - reported)
+                    download.speed.submit(download_range.end - reported)
+                    reported = download_range.end
+                    flush_at, flushed = now + flush_every, reads
+                if reads % tune_every == 0 and tuner is not None and now > t_mark:
+                    size = download.observe_speed((download_range.end - mark) / (now - t_mark))
+                    mark, t_mark = download_range.end, now
+                    if buf is not None and len(buf) < size:
+                        buf = _receive_buffer(size)
+                lease.consume(len(data))
+                to_end = download_range.stop_at - download_range.end  # no lock: stop_at is only moved by splits
+                if to_end <= len(data):  # expected to be chunk_size, but written as len(data) for safety.
+                    if to_end < 0:  # ruled out by claim; never write the wrong bytes or move end backwards
+                        _logger.error(f'thread {no}: overran the next segment by {-to_end}B.')
+                        to_end = 0
+                    download_range.end += to_end
+                    write(data[:to_end])
+                    observer.progress(str(no), to_end)
+                    if worker is not None:
+                        worker.received += to_end
+                    return False
+                else:
+                    download_range.end += len(data)  # expected to be chunk_size, but written as len(data) for safety.
+                    write(data)
+                    observer.progress(str(no), len(data))
+                    if worker is not None:
+                        worker.received += len(data)
+                        if worker.retired:  # the rest of the segment is left as a gap for the others
+                            return False
+                    if download.error is not None:  # another thread has failed the download
+                        return False
+    finally:
+        _release(html)  # keep-alive connections go back to the shared pool
+        received.inc(download_range.end - reported)
+        download.speed.submit(download_range.end - reported)
+
+
+def _download_thread(download: _Download, no, worker: Optional[_Worker] = None):
+    while (download_range := download.next_segment(str(no), worker)) is not None:
+        failed = False
+        try:
+            failed = _download_segment(download, download_range, no, worker)
+        except Exception as e:  # not a network error, which is retried: the download cannot go on
+            _logger.error(f'thread {no}: {e!r}')
+            download.fail(e)
+        finally:
+            _logger.debug(f'thread {no}: {download_range.start}-{download_range.end} downloaded.')
+            download.end_segment(download_range)  # wakes up the threads standing by
+        download.save_journal()
+        if failed:
+            sleep(2)
 
-            # goto find next position and recurse
-        else:  # successfully opened request stream for retrieval by chunk
-            _logger.debug(f'thread {no}: request success. response code = {html.status_code}')
-            # _logger.debug(f'thread {no}: cookies = {session.cookies.get_dict()}')
-            interface.submit_status(str(no), 'Retrieving...')
-            interface.start(str(no), start)
+    download.observer.submit_status(str(no), "Retired." if worker is not None and worker.retired else "Execution over.")
+    download.observer.finalise(str(no))
+    _logger.debug(f'thread {no}: EXECUTION OVER.')
+
+
+def _adapt_connections(download: _Download, controller: ConnectionController):
+    """
+    body of the controller thread of an adaptive download: start and retire worker threads as controller decides from
+    the aggregate throughput, until the download is finished.
+    """
+    workers: List[_Worker] = []
+    active: List[_Worker] = []
+
+    def start_worker():
+        worker = _Worker(len(workers))
+        worker.thread = threading.Thread(target=_download_thread, args=(download, worker.no, worker))
+        workers.append(worker)
+        active.append(worker)
+        worker.thread.start()
+
+    for _ in range(controller.count):
+        start_worker()
+    received, t = 0, monotonic()
+    while not download.finished.wait(control_interval):
+        now = monotonic()
+        total = sum(w.received for w in workers)
+        n = controller.update((total - received) / (now - t))
+        received, t = total, now
+        while len(active) < n:
+            start_worker()
+        if len(active) > n:
+            _logger.debug(f'controller: retiring {len(active) - n} of {len(active)} threads.')
+            with download.cond:
+                while len(active) > n:
+                    active.pop().retired = True  # the latest first: its segment is the youngest
+                download.cond.notify_all()  # threads standing by must notice
+    for worker in workers:
+        worker.thread.join()
+
+
+def _save_journals(downloads, stop: threading.Event):
+    """
+    save the journal of every download in downloads() each journal_interval, until stop is set.
+    """
+    while not stop.wait(journal_interval):
+        for download in downloads():
+            download.save_journal()
+
+
+def _as_limiter(rate_limit):
+    if rate_limit is None or isinstance(rate_limit, TokenBucket):
+        return rate_limit
+    return TokenBucket(rate_limit)
+
+
+def _journal_key(url, size, validators):
+    """
+    a journal is only resumed for the same url & size, and the same ETag & Last-Modified as the server sent then.
+    :return: None if the server sent neither: a changed content of the same size could not be told apart, so nothing
+    is journaled or resumed.
+    """
+    etag, last_modified = validators
+    if etag is None and last_modified is None:
+        return None
+    return {'url': url, 'size': size, 'etag': etag, 'last_modified': last_modified}
+
+
+def _prepare_storage(file_path, size, direct_write, debris_root, journal_key=None):
+    """
+    :return: (storage, ranges [(start, end), ...] already downloaded by an earlier run with the same journal_key)
+    """
+    makedirs(split(file_path)[0] or '.', exist_ok=True)
+
+    if direct_write:
+        storage = DirectStorage(file_path, size)
+    else:
+        if debris_root is None:
+            debris_root = temp_dir
+        makedirs(debris_root, exist_ok=True)
 
-            with open(debris_path, 'wb') as f:
-                while True:
-                    try:
-                        data = next(it)
-                    except (requests.RequestException, StopIteration) as e:
-                        _logger.error(f'thread {no}: failed to get data: {e}')
-                        interface.submit_status(str(no), 'Get data failed')
-                        download_range[2] = False
-                        sleep(2)
-                        break  # goto find next position and recurse
-                    with _mutex:
-                        to_end = _progress.get_next(download_range)[0] - download_range[1]
-                    if to_end <= len(data):  # expected to be chunk_size, but written as len(data) for safety.
-                        download_range[1] += to_end
-                        f.write(data[:to_end])
-                        interface.progress(str(no), to_end)
-                        break
-                    else:
-                        download_range[1] += len(
-                            data)  # expected to be chunk_size, but written as len(data) for safety.
-                        f.write(data)
-                        interface.progress(str(no), len(data))
-
-        _logger.debug(f'thread {no}: {start}-{download_range[1]} downloaded.')
-        download_range[2] = False
-        if download_range[0] == download_range[
-            1]:  # if nothing is downloaded, remove entry from progress (otherwise it causes a bug - see log)
-            with _mutex:
-                _progress.remove(download_range)
-
-    _mutex.acquire()  # lock until mark set in progress.
-    next_start = _progress.find_insert_pt()
-    _download_thread(debris_dir, url, size, next_start, no, headers, timeout, **kwargs)
-
-
-def _merge_debris(debris_dir, final_path):
-    with open(final_path, 'wb') as final:
-        total_len = 0
-        for d in sorted(listdir(debris_dir), key=lambda x: int(x.split('.')[0])):
-            d = join(debris_dir, d)
-            with open(d, 'rb') as debris:
-                data = debris.read()
-                total_len += len(data)
-                final.write(data)
-    return total_len
-
-
-def _dispatch_download(file_path, url, size, thread_count, headers, timeout, **kwargs):
-    _progress.clear()
-    _progress.ins([size, size, False])
-    _progress.ins([0, 0, False])
-
-    makedirs(temp_dir, exist_ok=True)
-
-    debris_dir = join(temp_dir, _get_name_no_ext(file_path))
-
-    debris_dir = _validate_folder_path(
-        debris_dir)  # strip leading & trailing spaces, and trailing periods, from folder name.
-
-    if exists(debris_dir):
-        shutil.rmtree(debris_dir)  # clean up first
-    makedirs(debris_dir, exist_ok=True)
-    makedirs(split(file_path)[0], exist_ok=True)
-
-    pool = []
-    for i in range(thread_count):
-        pool.append(
-            threading.Thread(target=_download_thread,
-                             args=(
-                                 debris_dir, url, size, size // thread_count * i, i, headers, timeout), kwargs=kwargs))
-
-    ####### GUI
-    global interface
-    interface = Interface(url, headers, file_path, size)
-
-    def shut_on_all_done():
-        if any([th.is_alive() for th in pool]):
-            interface.after(2000, shut_on_all_done)
-            return
-        interface.destroy()
+        debris_dir = join(debris_root, _get_name_no_ext(file_path))
 
-    interface.after(0, shut_on_all_done)
-    interface.protocol('WM_DELETE_WINDOW', lambda: '')
-    for th in pool:
-        th.start()
+        debris_dir = _validate_folder_path(
+            debris_dir)  # strip leading & trailing spaces, and trailing periods, from folder name.
 
-    interface.mainloop()
+        storage = DebrisStorage(debris_dir)
+    done = storage.prepare(journal_key)
+    if done:
+        _logger.debug(f'resuming {sum(end - start for start, end in done)}B of {file_path} in {len(done)} segments.')
+    return storage, done
 
-    # for th in pool:
-    #     th.join()
 
-    downloaded_size = _merge_debris(debris_dir, file_path)
+def _finish_storage(download: _Download, file_path, size):
+    download.drop_response()  # e.g. nothing to download
+    download.close_journal()
+    storage = download.storage
+    t = monotonic()
+    with tracing.span('merge', 'disk', file=file_path):
+        downloaded_size = storage.finish(file_path)
+    metrics.merge_duration.observe(monotonic() - t)
 
     if downloaded_size != size:
         raise IOError(f'(downloaded size({downloaded_size}B) does not tally with the size given by server({size}B).')
 
-    shutil.rmtree(debris_dir)
+    storage.cleanup()
+
+
+def _dispatch_download(file_path, url, size, thread_count, headers, timeout, observer=None, direct_write=False,
+                       debris_root=None, split_policy=None, journal_key=None, chunk_size=None,
+                       min_insertion_interval=None, adaptive=False, limiter=None, response=None, **kwargs):
+    try:
+        storage, done = _prepare_storage(file_path, size, direct_write, debris_root, journal_key)
+    except OSError:
+        if response is not None:
+            _release(response)
+        raise
+
+    speed = _download_speed(url)
+    interface = None
+    if observer is None:  # GUI; otherwise headless: no Tk at all, workers only report to the given observer
+        from interface import Interface  # imports tkinter, so only when a window is needed
+        interface = observer = Interface(url, headers, file_path, size, speed=speed)
+
+    download = _Download(url, size, headers, timeout, storage, observer, kwargs, split_policy, journal_key=journal_key,
+                         chunk_size=chunk_size, min_insertion_interval=min_insertion_interval, limiter=limiter,
+                         session=session_pool.session(url, thread_count), response=response, speed=speed)
+    adaptive = adaptive and thread_count > 1
+    controller = ConnectionController(maximum=thread_count) if adaptive else None
+    initial_count = controller.count if adaptive else thread_count
+    if done:
+        download.resume(done)  # the gaps left are found by split_policy
+    else:
+        with download.cond:
+            download.reserve(size // initial_count * i for i in range(initial_count))
+    # handshakes in parallel, before the first requests. the segment at 0 reads on the connection of the pre-check.
+    session_pool.prewarm(url, initial_count - (download.response is not None), timeout, kwargs)
+
+    if adaptive:  # the controller thread owns the worker threads
+        pool = [threading.Thread(target=_adapt_connections, args=(download, controller))]
+    else:
+        pool = [threading.Thread(target=_download_thread, args=(download, i)) for i in range(thread_count)]
+    stop_saving = threading.Event()
+    threading.Thread(target=_save_journals, args=(lambda: [download], stop_saving), daemon=True).start()
+
+    if interface is None:
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        observer.close()
+    else:
+        ####### GUI
+        def shut_on_all_done():
+            if any([th.is_alive() for th in pool]):
+                interface.after(2000, shut_on_all_done)
+                return
+            interface.destroy()
+
+        interface.after(0, shut_on_all_done)
+        interface.protocol('WM_DELETE_WINDOW', lambda: '')
+        for th in pool:
+            th.start()
 
+        interface.mainloop()
 
-#########################################
+    stop_saving.set()
+    if download.error is not None:  # the data is kept, with its journal, for a later run to resume
+        download.drop_response()
+        raise download.error
+    _finish_storage(download, file_path, size)
 
 
-# exposed interface
-def download_with_progress(file_path, url, thread_count=min(32, os.cpu_count() + 4), headers=None, timeout=20,
-                           raise_for_status=True, **kwargs):
-    if timeout is None:
-        raise ValueError('cannot have timeout unspecified due to download mechanism.')
+#########################################
 
-    _logger.debug(f"thread main: START DOWNLOADING: '{_get_name_no_ext(file_path)}'. ")
-    s_t = time()
+_default_headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36'
+}
 
-    if headers is None:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36'
-        }
 
-    ##################### start pre-check
+def _precheck(url, headers, timeout, raise_for_status, kwargs):
+    """
+    note: removes 'Range' from headers.
+    :return: (total size, whether range requests are accepted, (ETag, Last-Modified) or None for a missing header,
+    the response with its body not read yet, or None). the response is exactly what a thread downloading from 0 would
+    get, so it should be handed to that thread (see _Download.take_response), or released.
+    """
     headers.pop('Range', None)
 
     headers_copy = dict(headers)
@@ -260,51 +657,382 @@ def download_with_progress(file_path, url, thread_count=min(32, os.cpu_count() +
     # temprarily remove 'method' value from kwargs; if non-existent, default to 'GET'.
     method = kwargs.pop('method', 'GET')
 
-    resp = requests.get(url, headers=headers_copy, timeout=timeout, stream=True, **kwargs)
-    if raise_for_status:
-        resp.raise_for_status()
+    resp = session_pool.session(url).get(url, headers=headers_copy, timeout=timeout, stream=True, **kwargs)
 
     # add back
     kwargs['method'] = method
 
     total_size = _get_size(resp)
-    if total_size is None:
-        raise requests.RequestException('essential header "content-length" is not supported for this request.')
+    validators = (resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+    # the threads send `method`, so the body is only theirs if that is a GET too.
+    if total_size is None or method.upper() != 'GET' or not _is_status_code_valid(resp.status_code):
+        _release(resp)
+        if raise_for_status:
+            resp.raise_for_status()
+        if total_size is None:
+            raise requests.RequestException('essential header "content-length" is not supported for this request.')
+        return total_size, _check_range_acceptable(resp), validators, None
+
+    return total_size, _check_range_acceptable(resp), validators, resp
+
+
+def _split_policy(split_policy):
+    """
+    :return: the function of split_policy, a name in SPLIT_POLICIES or a callable (or None, for split_random).
+    """
+    if isinstance(split_policy, str):
+        if split_policy not in SPLIT_POLICIES:
+            raise ValueError(f'split_policy must be one of {list(SPLIT_POLICIES)} or a callable.')
+        return SPLIT_POLICIES[split_policy]
+    if split_policy is not None and not callable(split_policy):
+        raise ValueError(f'split_policy must be one of {list(SPLIT_POLICIES)} or a callable.')
+    return split_policy
 
-    if not _check_range_acceptable(resp):
-        thread_count = 1
 
-    # cap actual no of threads if content size is too small as compared to min_insertion_interval
-    # but code works totally perfectly even without these two lines.
-    if total_size / min_insertion_interval < thread_count:
-        thread_count = ceil(total_size / min_insertion_interval)
+# exposed interface
+def download_with_progress(file_path, url, thread_count=min(32, os.cpu_count() + 4), headers=None, timeout=20,
+                           raise_for_status=True, headless=False, observer: Optional[ProgressObserver] = None,
+                           direct_write=False, debris_root=None, split_policy='eta', resume=True, chunk_size=None,
+                           min_insertion_interval=None, adaptive=False, rate_limit=None, trace=None, **kwargs):
+    """
+    :param thread_count: number of connections, or their maximum if adaptive.
+    :param headless: if set to True, no Tk window is created, so no display is needed.
+    :param observer: receives progress events in headless mode. defaults to a no-op ProgressObserver;
+    pass a CallbackObserver to get rate-limited progress snapshots. giving an observer implies headless.
+    :param direct_write: if set to True, file_path is preallocated and every thread writes straight to its own offset
+    in it, instead of writing debris files that are merged at the end.
+    :param debris_root: folder to keep debris files in, default temp_dir. put it on the same file system as file_path
+    so that the kernel can merge debris without copying through user space, and a download that ends up in a single
+    debris file is simply renamed.
+    :param split_policy: how a thread that finished its segment picks where to continue: 'eta' (split the gap expected
+    to finish last so that both threads finish together), 'largest' (midpoint of the largest gap), 'random' (midpoint
+    of a random gap, the former behaviour), or a callable f(progress, min_insertion_interval) -> pos, -1 or -2.
+    :param resume: if set to True, the downloaded ranges are journaled beside the partial data, and a download
+    interrupted by a crash or restart continues from them, as long as url, size, ETag and Last-Modified are unchanged.
+    only done if the server sends an ETag or a Last-Modified; otherwise the download always starts over.
+    :param chunk_size: size of each read in bytes. auto-tuned from the measured throughput if not given.
+    :param min_insertion_interval: smallest gap in bytes that is split for another thread. auto-tuned from the measured
+    time to first byte and throughput if not given.
+    :param adaptive: if set to True, start with a few connections, and add or retire connections while the download
+    goes on, depending on whether that still raises the aggregate throughput (see tuning.ConnectionController).
+    :param rate_limit: cap of the bandwidth of this download in bytes/s (None: no cap; 0 or less raises ValueError),
+    or a TokenBucket, whose rate and burst can be changed while downloading with its set(), which leaves a parameter
+    not given as it is, and which may be shared by several downloads. all downloads of the process are also capped by
+    global_limiter (unlimited unless set).
+    :param trace: path to write a trace of this download to, in the Chrome trace event format (see tracing).
+    """
+    if timeout is None:
+        raise ValueError('cannot have timeout unspecified due to download mechanism.')
+    split_policy = _split_policy(split_policy)
 
-    ##################### end pre-check
+    _logger.debug(f"thread main: START DOWNLOADING: '{_get_name_no_ext(file_path)}'. ")
+    s_t = time()
 
-    _dispatch_download(file_path, url, total_size, thread_count, headers, timeout, **kwargs)
+    if headers is None:
+        headers = dict(_default_headers)
+
+    tracing_here = trace is not None and tracing.tracer is None  # otherwise the process is traced already
+    if tracing_here:
+        tracing.start(trace)
+    try:
+        total_size, range_acceptable, validators, response = _precheck(url, headers, timeout, raise_for_status,
+                                                                       kwargs)
+        journal_key = _journal_key(url, total_size, validators) if resume and range_acceptable else None
+
+        if not range_acceptable:
+            thread_count = 1
+
+        # cap actual no of threads if content size is too small as compared to min_insertion_interval
+        # but code works totally perfectly even without these two lines.
+        initial_interval = min_insertion_interval or _default_sizes()[1]
+        if total_size / initial_interval < thread_count:
+            thread_count = ceil(total_size / initial_interval)
+
+        if observer is None and headless:
+            observer = ProgressObserver()
+        if isinstance(observer, CallbackObserver) and observer.size is None:
+            observer.size = total_size
+
+        _dispatch_download(file_path, url, total_size, thread_count, headers, timeout, observer, direct_write,
+                           debris_root, split_policy, journal_key, chunk_size, min_insertion_interval, adaptive,
+                           _as_limiter(rate_limit), response, **kwargs)
+    finally:
+        if tracing_here:
+            tracing.stop()
     e_t = time()
     dur = e_t - s_t
     _logger.debug(f"thread main: DOWNLOADING FINISHED IN {_fmt_dur_in_s(dur)}. ")
 
 
-# temporarily no use
-def get_responses(urls, headers_l=None, data_l=None, timeout=20, thread_count=7):
-    if headers_l is None:
-        headers_l = [{
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36'
-        }] * len(urls)
-    if data_l is None:
-        data_l = [None] * len(urls)
-
-    with ThreadPoolExecutor(max_workers=thread_count) as exe:
-        futures = []
-        for url, headers, data in zip(urls, headers_l, data_l):
-            futures.append(exe.submit(requests.get, url, headers=headers, data=data, timeout=timeout))
-
-    results = []
-    for each in futures:
-        results.append(each.result())
-    return results
+_JOB_OPTIONS = ('direct_write', 'debris_root', 'split_policy', 'resume', 'chunk_size', 'min_insertion_interval',
+                'rate_limit')
+
+
+def _job_options(options):
+    """
+    check options of DownloadManager before any file starts, as download_with_progress does.
+    :return: options, with split_policy resolved to its function.
+    """
+    unknown = set(options) - set(_JOB_OPTIONS)
+    if unknown:
+        raise TypeError(f'unexpected options {sorted(unknown)}; the options of a file are {list(_JOB_OPTIONS)}.')
+    if 'split_policy' in options:
+        options = {**options, 'split_policy': _split_policy(options['split_policy'])}
+    return options
+
+
+class DownloadJob:
+    """
+    one file of a DownloadManager. after the manager has run, error is None if the file has been downloaded.
+    """
+    PENDING = 'pending'
+    STARTING = 'starting'  # pre-check in progress
+    RUNNING = 'running'
+    FINISHING = 'finishing'  # merging
+    DONE = 'done'
+
+    def __init__(self, seq, file_path, url, priority, headers, max_connections, observer, options):
+        self.seq = seq
+        self.file_path = file_path
+        self.url = url
+        self.priority = priority
+        self.headers = headers
+        self.max_connections = max_connections
+        self.observer = observer
+        self.options = options  # see _JOB_OPTIONS
+        self.host = urlsplit(url).netloc
+        self.state = DownloadJob.PENDING
+        self.size = None
+        self.error: Optional[BaseException] = None
+        self.download: Optional[_Download] = None
+        self.active = 0  # connections currently used by this job
+
+    def key(self):
+        return -self.priority, self.seq
+
+    def __repr__(self):
+        return f'DownloadJob({self.file_path!r}, state={self.state}, priority={self.priority}, error={self.error!r})'
+
+
+class DownloadManager:
+    """
+    downloads many files with one global budget of max_connections worker threads.
+    each worker repeatedly takes the most urgent piece of work: a new segment of a running file in priority order
+    (higher priority first, then first added), or the pre-check of a pending file.
+    a file is split across workers as they become free, so connections freed by a finished file immediately go to
+    the files still running, and no file opens connections it cannot use.
+    per_host caps the connections to one host (netloc) across all files.
+    """
+
+    def __init__(self, max_connections=32, per_host=8, headers=None, timeout=20, raise_for_status=True,
+                 observer_factory=None, **kwargs):
+        """
+        :param observer_factory: f(job) -> ProgressObserver, called when a file starts. defaults to no-op observers.
+        :param kwargs: default options of every file (see _JOB_OPTIONS; a rate_limit number caps each file, while a
+        TokenBucket is shared by all of them), and keyword
+        arguments of requests.
+        """
+        if timeout is None:
+            raise ValueError('cannot have timeout unspecified due to download mechanism.')
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.headers = headers
+        self.timeout = timeout
+        self.raise_for_status = raise_for_status
+        self.observer_factory = observer_factory
+        self.options = _job_options({k: kwargs.pop(k) for k in _JOB_OPTIONS if k in kwargs})
+        self.kwargs = kwargs
+
+        self.jobs: List[DownloadJob] = []
+        self._pending: List[DownloadJob] = []  # sorted by key
+        self._running: List[DownloadJob] = []  # sorted by key
+        self._host_active: Dict[str, int] = {}
+        self._unfinished = 0
+        self.cond = threading.Condition(threading.Lock())  # shared by all _Downloads of this manager
+
+    def add(self, file_path, url, priority=0, headers=None, max_connections=None, observer=None, **options):
+        """
+        :param max_connections: cap of connections of this file, default no cap other than the manager's.
+        :param options: options of download_with_progress in _JOB_OPTIONS, overriding the manager's.
+        :return: the DownloadJob.
+        """
+        options = {**self.options, **_job_options(options)}
+        if headers is None:
+            headers = dict(self.headers if self.headers is not None else _default_headers)
+        with self.cond:
+            job = DownloadJob(len(self.jobs), file_path, url, priority, headers, max_connections, observer, options)
+            self.jobs.append(job)
+            insort(self._pending, job, key=DownloadJob.key)
+            self._unfinished += 1
+            self.cond.notify()
+        return job
+
+    def run(self):
+        """
+        download all added files (including those added while running) and return when every one has finished.
+        :return: the list of DownloadJob; check their error.
+        """
+        pool = [threading.Thread(target=self._worker, args=(i,)) for i in range(self.max_connections)]
+        stop_saving = threading.Event()
+        threading.Thread(target=_save_journals, args=(self._running_downloads, stop_saving), daemon=True).start()
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        stop_saving.set()
+        return self.jobs
+
+    def _running_downloads(self):
+        with self.cond:
+            return [job.download for job in self._running]
+
+    def _has_room(self, job: DownloadJob):
+        return (self._host_active.get(job.host, 0) < self.per_host and
+                (job.max_connections is None or job.active < job.max_connections))
+
+    def _use(self, job: DownloadJob, n):
+        job.active += n
+        self._host_active[job.host] = self._host_active.get(job.host, 0) + n
+
+    def _pick(self):
+        """
+        cond must be held.
+        :return: (job, Segment) to download, (job, None) to start, or (None, None) if there is nothing to do now.
+        """
+        pending = (job for job in self._pending if self._has_room(job))
+        next_pending = next(pending, None)
+        for job in self._running:
+            if next_pending is not None and next_pending.key() < job.key():
+                break
+            if not self._has_room(job):
+                continue
+            seg = job.download.claim()
+            if isinstance(seg, Segment):
+                return job, seg
+        if next_pending is not None:
+            self._pending.remove(next_pending)
+            next_pending.state = DownloadJob.STARTING
+            return next_pending, None
+        return None, None
+
+    def _start(self, job: DownloadJob):
+        """
+        pre-check job and prepare its storage. called without cond held.
+        """
+        options = dict(job.options)
+        split_policy = options.pop('split_policy', SPLIT_POLICIES['eta'])  # resolved by add
+        kwargs = dict(self.kwargs)
+        response = download = None
+        try:
+            job.size, range_acceptable, validators, response = _precheck(job.url, job.headers, self.timeout,
+                                                                         self.raise_for_status, kwargs)
+            journal_key = (_journal_key(job.url, job.size, validators)
+                           if options.get('resume', True) and range_acceptable else None)
+            storage, done = _prepare_storage(job.file_path, job.size, options.get('direct_write', False),
+                                             options.get('debris_root'), journal_key)
+            connections = min(self.per_host, job.max_connections or self.per_host) if range_acceptable else 1
+            session_pool.prewarm(job.url, connections - (response is not None), self.timeout, kwargs)
+            if job.observer is None:
+                job.observer = self.observer_factory(job) if self.observer_factory is not None else ProgressObserver()
+            if not range_acceptable:
+                job.max_connections = 1
+            download = _Download(job.url, job.size, job.headers, self.timeout, storage, job.observer, kwargs,
+                                 split_policy, cond=self.cond, journal_key=journal_key,
+                                 chunk_size=options.get('chunk_size'),
+                                 min_insertion_interval=options.get('min_insertion_interval'),
+                                 limiter=_as_limiter(options.get('rate_limit')),
+                                 session=session_pool.session(job.url, self.per_host), response=response)
+            download.resume(done)
+        except Exception as e:  # any error ends the job only, or run() would wait for it forever
+            if download is not None:
+                download.drop_response()
+            elif response is not None:
+                _release(response)
+            _logger.error(f'manager: failed to start {job.url}: {e!r}')
+            with self.cond:
+                self._end_job(job, e)
+            return
+        with self.cond:
+            job.download = download
+            if job.size == 0 or sum(end - start for start, end in done) == job.size:
+                job.state = DownloadJob.FINISHING
+            else:
+                if not done:
+                    job.download.reserve([0])
+                job.state = DownloadJob.RUNNING
+                insort(self._running, job, key=DownloadJob.key)
+                self.cond.notify_all()
+                return
+        self._finish(job)  # empty or fully resumed content: nothing to download
+
+    def _end_job(self, job: DownloadJob, error=None):
+        job.error = error
+        job.state = DownloadJob.DONE
+        self._unfinished -= 1
+        self.cond.notify_all()
+
+    def _finish(self, job: DownloadJob):
+        """
+        merge job once all of its segments have ended. called without cond held.
+        """
+        download = job.download
+        error = download.error
+        try:
+            if error is None:
+                _finish_storage(download, job.file_path, job.size)
+            else:  # the data is kept, with its journal, for a later run to resume
+                download.drop_response()
+                download.close_journal()
+            job.observer.close()
+        except Exception as e:  # as in _start
+            _logger.error(f'manager: failed to finish {job.file_path}: {e!r}')
+            error = error or e
+        with self.cond:
+            self._end_job(job, error)
+
+    def _worker(self, no):
+        while True:
+            with self.cond:
+                while True:
+                    if self._unfinished == 0:
+                        job = None
+                        break
+                    job, seg = self._pick()
+                    if job is not None:
+                        self._use(job, 1)
+                        break
+                    self.cond.wait()
+            if job is None:
+                break
+
+            if seg is None:
+                self._start(job)
+                with self.cond:
+                    self._use(job, -1)
+                    self.cond.notify_all()
+                continue
+
+            failed = False
+            try:
+                failed = _download_segment(job.download, seg, no)
+            except Exception as e:  # as in _download_thread; the job ends with e once its other segments have left
+                _logger.error(f'manager: {job.file_path}: {e!r}')
+                job.download.fail(e)
+            finally:
+                job.download.end_segment(seg)
+            job.download.save_journal()  # still counted in job.active, so the job cannot be finished meanwhile
+            with self.cond:
+                self._use(job, -1)
+                finished = (job.state == DownloadJob.RUNNING and job.active == 0 and
+                            (job.download.error is not None or
+                             not job.download.queue and job.download.progress.find_insert_pt(0) == -2))
+                if finished:
+                    job.state = DownloadJob.FINISHING
+                    self._running.remove(job)
+            if finished:
+                self._finish(job)
+            elif failed:
+                sleep(2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,360 @@
+#
+# Created on 2026/10/18.
+#
+# asyncio download engine: same segmenting as the threaded engine in __init__.py (SegmentMap, split policies,
+# storages, observers), but every connection is a coroutine on one event loop instead of an OS thread with its own
+# requests.Session, so thousands of ranges can be driven from a single thread.
+import asyncio
+import logging
+import ssl
+from collections import deque
+from os import makedirs
+from os.path import join, split
+from time import monotonic
+from typing import Optional
+from urllib.parse import urlsplit, urljoin
+
+from observer import ProgressObserver
+from segments import Segment, SegmentMap, SPLIT_POLICIES
+from storage import DebrisStorage, DirectStorage
+from utils import _get_name_no_ext, _validate_folder_path, _is_status_code_valid
+
+_logger = logging.getLogger('hsrequest_logger')
+
+_MAX_REDIRECTS = 10
+_MAX_HEADER_LINE = 65536
+_MAX_DISCARD = 65536  # body bytes read to keep a connection after e.g. a redirect; a larger body closes it
+
+temp_dir = join(split(__file__)[0], 'temp_debris_st')  # same default debris folder as the threaded engine
+
+
+class HTTPError(IOError):
+    pass
+
+
+class _Response:
+    """
+    a minimal HTTP/1.1 response read from an asyncio stream. the body is read with read(), which honours
+    Content-Length and chunked transfer encoding.
+    """
+
+    def __init__(self, reader, writer, status_code, headers):
+        self.reader = reader
+        self.writer = writer
+        self.status_code = status_code
+        self.headers = headers  # lower-cased names
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        length = headers.get('content-length')
+        self.remaining = int(length) if length is not None and not self.chunked else None  # None: until EOF
+        self._chunk_left = 0
+        self._eof = False
+
+    async def read(self, n):
+        """
+        :return: up to n bytes of the body, or b'' at the end of the body.
+        """
+        if self._eof:
+            return b''
+        if self.chunked:
+            if self._chunk_left == 0:
+                size_line = await self.reader.readline()
+                self._chunk_left = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if self._chunk_left == 0:
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):  # trailers
+                        pass
+                    self._eof = True
+                    return b''
+            data = await self.reader.read(min(n, self._chunk_left))
+            if not data:
+                raise HTTPError('connection closed in the middle of a chunk.')
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await self.reader.readexactly(2)  # CRLF after chunk data
+            return data
+        if self.remaining is not None:
+            if self.remaining == 0:
+                self._eof = True
+                return b''
+            n = min(n, self.remaining)
+        data = await self.reader.read(n)
+        if not data:
+            if self.remaining:
+                raise HTTPError(f'connection closed with {self.remaining}B of body unread.')
+            self._eof = True
+            return b''
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def reusable(self):
+        return self._eof and self.headers.get('connection', '').lower() != 'close'
+
+
+class _Connection:
+    """
+    a keep-alive connection to one origin; re-opened when the previous response could not be read to its end.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.origin = None
+        self.reader = None
+        self.writer = None
+
+    async def request(self, url, headers):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        origin = (parts.scheme, parts.hostname, port)
+        if self.writer is None or self.origin != origin or self.reader.at_eof():
+            self.close()
+            ssl_ctx = ssl.create_default_context() if parts.scheme == 'https' else None
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, port, ssl=ssl_ctx, limit=_MAX_HEADER_LINE), self.timeout)
+            self.origin = origin
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+        lines = [f'GET {path} HTTP/1.1', f'Host: {host}']
+        lines += [f'{k}: {v}' for k, v in headers.items() if k.lower() not in ('host', 'accept-encoding')]
+        lines.append('Accept-Encoding: identity')  # ranges are byte offsets of the raw content
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        async def read_head():
+            await self.writer.drain()
+            status_line = await self.reader.readline()
+            if not status_line:
+                raise HTTPError('connection closed before response.')
+            try:
+                status_code = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                raise HTTPError(f'malformed status line {status_line[:80]!r}.') from None
+            resp_headers = {}
+            while (line := await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                k, _, v = line.decode('latin-1').partition(':')
+                resp_headers[k.strip().lower()] = v.strip()
+            return status_code, resp_headers
+
+        try:
+            status_code, resp_headers = await asyncio.wait_for(read_head(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+        return _Response(self.reader, self.writer, status_code, resp_headers)
+
+    def release(self, resp: _Response):
+        if not resp.reusable():
+            self.close()
+
+    async def discard(self, resp: _Response):
+        """
+        read the rest of a small body, so that the next request can be sent on this connection; otherwise close it.
+        """
+        if resp.chunked or resp.remaining is not None and resp.remaining <= _MAX_DISCARD:
+            left = _MAX_DISCARD
+            try:
+                while left > 0 and (data := await asyncio.wait_for(resp.read(left), self.timeout)):
+                    left -= len(data)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                self.close()
+                return
+        self.release(resp)  # closed unless the body has been read to its end
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = self.reader = None
+
+
+class _AsyncDownload:
+    """
+    asyncio counterpart of _Download in __init__.py.
+    """
+
+    def __init__(self, url, size, headers, timeout, storage, observer, split_policy, chunk_size,
+                 min_insertion_interval):
+        self.url = url
+        self.size = size
+        self.headers = headers
+        self.timeout = timeout
+        self.storage = storage
+        self.observer = observer
+        self.split_policy = split_policy
+        self.chunk_size = chunk_size
+        self.min_insertion_interval = min_insertion_interval
+
+        self.progress = SegmentMap()
+        self.progress.ins(Segment(size, size, False))
+        self.progress.ins(Segment(0, 0, False))
+        self.cond = asyncio.Condition()
+        self.queue = deque()
+
+    async def next_segment(self, label):
+        async with self.cond:
+            while True:
+                if self.queue:
+                    pos = self.queue.popleft()
+                else:
+                    pos = self.progress.find_insert_pt(self.min_insertion_interval, self.split_policy)
+                if pos == -2:
+                    return None
+                if pos != -1:
+                    seg = Segment(pos, pos, True)
+                    self.progress.ins(seg)
+                    return seg
+                self.observer.submit_status(label, "Stand by.")
+                self.observer.finalise(label)
+                await self.cond.wait()
+
+    async def end_segment(self, seg):
+        async with self.cond:
+            seg.ongoing = False
+            if seg.start == seg.end:
+                self.progress.remove(seg)
+            self.cond.notify_all()
+
+
+async def _download_segment(download: _AsyncDownload, conn: _Connection, download_range: Segment, label):
+    """
+    :return: True if the download was interrupted by an error.
+    """
+    observer = download.observer
+    start = download_range.start
+    headers = dict(download.headers)
+    headers['Range'] = f'bytes={start}-'
+
+    try:
+        observer.submit_status(label, 'Sending request...')
+        resp = await conn.request(download.url, headers)
+        if not _is_status_code_valid(resp.status_code) or (start != 0 and resp.status_code != 206):
+            conn.close()
+            raise HTTPError(f'invalid response code = {resp.status_code}.')
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+        observer.submit_status(label, 'Get response failed')
+        _logger.error(f'task {label}: failed to get response: {e!r}')
+        return True
+
+    observer.submit_status(label, 'Retrieving...')
+    observer.start(label, start)
+    download_range.t_start = monotonic()
+
+    with download.storage.open_segment(start) as f:
+        while True:
+            try:
+                data = await asyncio.wait_for(resp.read(download.chunk_size), download.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                _logger.error(f'task {label}: failed to get data: {e!r}')
+                observer.submit_status(label, 'Get data failed')
+                conn.close()
+                return True
+            if not data:
+                conn.release(resp)
+                return download_range.end != download_range.stop_at
+            to_end = download_range.stop_at - download_range.end
+            if to_end <= len(data):
+                download_range.end += to_end
+                f.write(data[:to_end])
+                observer.progress(label, to_end)
+                if to_end < len(data) or resp.remaining:
+                    conn.close()  # the rest of the body belongs to another segment
+                else:
+                    conn.release(resp)
+                return False
+            download_range.end += len(data)
+            f.write(data)
+            observer.progress(label, len(data))
+
+
+async def _download_task(download: _AsyncDownload, no):
+    label = str(no)
+    conn = _Connection(download.timeout)
+    try:
+        while (download_range := await download.next_segment(label)) is not None:
+            failed = await _download_segment(download, conn, download_range, label)
+            await download.end_segment(download_range)
+            if failed:
+                await asyncio.sleep(2)
+    finally:
+        conn.close()
+    download.observer.submit_status(label, "Execution over.")
+    download.observer.finalise(label)
+
+
+async def _probe(url, headers, timeout):
+    """
+    follow redirects and read the size of the content.
+    :return: (final url, size, whether ranges are accepted)
+    """
+    conn = _Connection(timeout)
+    try:
+        for _ in range(_MAX_REDIRECTS + 1):
+            resp = await conn.request(url, {**headers, 'Range': 'bytes=0-'})
+            if resp.status_code in (301, 302, 303, 307, 308) and 'location' in resp.headers:
+                url = urljoin(url, resp.headers['location'])
+                await conn.discard(resp)  # its body must not be read as the head of the next response
+                continue
+            content_range = resp.headers.get('content-range', '')
+            if resp.status_code == 416 and content_range.startswith('bytes */'):  # empty content
+                return url, int(content_range.rsplit('/', 1)[1]), True
+            if not _is_status_code_valid(resp.status_code):
+                raise HTTPError(f'invalid response code = {resp.status_code}.')
+            if resp.status_code == 206 and '/' in content_range and not content_range.endswith('*'):
+                size = int(content_range.rsplit('/', 1)[1])
+            elif 'content-length' in resp.headers:
+                size = int(resp.headers['content-length'])
+            else:
+                raise HTTPError('essential header "content-length" is not supported for this request.')
+            accept_ranges = resp.status_code == 206 or resp.headers.get('accept-ranges') == 'bytes'
+            return url, size, accept_ranges
+        raise HTTPError(f'exceeded {_MAX_REDIRECTS} redirects.')
+    finally:
+        conn.close()
+
+
+# exposed interface
+async def download(file_path, url, connections=64, headers=None, timeout=20, observer: Optional[ProgressObserver] = None,
+                   direct_write=True, debris_root=None, split_policy='eta', chunk_size=40960,
+                   min_insertion_interval=4096000):
+    """
+    download url to file_path over up to `connections` concurrent range requests on the running event loop.
+    parameters mean the same as in download_with_progress; there is no GUI, observer defaults to a no-op.
+    :return: the size of the downloaded content.
+    """
+    if headers is None:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.105 Safari/537.36'
+        }
+    headers = {k: v for k, v in headers.items() if k.lower() != 'range'}
+    if isinstance(split_policy, str):
+        split_policy = SPLIT_POLICIES[split_policy]
+    if observer is None:
+        observer = ProgressObserver()
+
+    url, size, accept_ranges = await _probe(url, headers, timeout)
+    if not accept_ranges:
+        connections = 1
+    connections = min(connections, -(-size // min_insertion_interval))  # no task at all for empty content
+
+    makedirs(split(file_path)[0] or '.', exist_ok=True)
+    if direct_write:
+        storage = DirectStorage(file_path, size)
+    else:
+        debris_root = temp_dir if debris_root is None else debris_root
+        makedirs(debris_root, exist_ok=True)
+        storage = DebrisStorage(_validate_folder_path(join(debris_root, _get_name_no_ext(file_path))))
+    storage.prepare()
+
+    d = _AsyncDownload(url, size, headers, timeout, storage, observer, split_policy, chunk_size,
+                       min_insertion_interval)
+    d.queue.extend(size // connections * i for i in range(connections))
+    try:
+        await asyncio.gather(*(_download_task(d, i) for i in range(connections)))
+    finally:
+        observer.close()
+
+    downloaded_size = storage.finish(file_path)
+    if downloaded_size != size:
+        raise IOError(f'(downloaded size({downloaded_size}B) does not tally with the size given by server({size}B).')
+    storage.cleanup()
+    return size
@@ -0,0 +1,70 @@
+#
+# Created on 2026/10/18.
+#
+# contention benchmark of the per-chunk boundary check in the download loop:
+# 'locked' takes the global mutex and looks up the next segment (the former design),
+# 'stop_at' reads the worker's own Segment.stop_at without any lock.
+# every worker also splits its segment now and then, which is the only operation that needs the mutex in both designs.
+# usage: python benchmarks/bench_contention.py [worker counts...]
+import sys
+import threading
+from os.path import dirname, abspath
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from segments import Segment, SegmentMap
+
+_CHUNKS_PER_WORKER = 20000
+_SPLIT_EVERY = 2000  # chunks between two splits of a worker
+_CHUNK = 40960
+
+
+def _run(worker_count, locked):
+    mutex = threading.Lock()
+    size = worker_count * _CHUNKS_PER_WORKER * _CHUNK * 4
+    progress = SegmentMap()
+    progress.ins(Segment(0, 0, False))
+    progress.ins(Segment(size, size, False))
+    segs = []
+    for i in range(worker_count):
+        seg = Segment(size // worker_count * i, size // worker_count * i, True)
+        progress.ins(seg)
+        segs.append(seg)
+    barrier = threading.Barrier(worker_count + 1)
+
+    def worker(seg):
+        barrier.wait()
+        for i in range(_CHUNKS_PER_WORKER):
+            if locked:
+                with mutex:
+                    to_end = progress.get_next(seg).start - seg.end
+            else:
+                to_end = seg.stop_at - seg.end
+            if to_end > _CHUNK:
+                seg.end += _CHUNK
+            if i % _SPLIT_EVERY == 0:
+                with mutex:
+                    pos = (seg.end + seg.stop_at) // 2
+                    progress.ins(Segment(pos, pos, False))
+
+    threads = [threading.Thread(target=worker, args=(seg,)) for seg in segs]
+    for th in threads:
+        th.start()
+    barrier.wait()
+    t = perf_counter()
+    for th in threads:
+        th.join()
+    return perf_counter() - t
+
+
+def main(counts):
+    print(f'{"workers":>7} {"design":>8} {"wall s":>8} {"chunks/s":>12}')
+    for n in counts:
+        for locked in (True, False):
+            dur = _run(n, locked)
+            print(f'{n:>7} {"locked" if locked else "stop_at":>8} {dur:>8.3f} {n * _CHUNKS_PER_WORKER / dur:>12.0f}')
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [32, 64, 128])
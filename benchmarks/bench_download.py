@@ -0,0 +1,235 @@
+#
+# Created on 2026/10/18.
+#
+# end-to-end benchmark of download_with_progress, headless, against a local RangeServer that can emulate a remote one.
+# every cell of the matrix thread_count x chunk_size x min_insertion_interval x resume x file size is downloaded in a
+# new interpreter, which reports its wall time, CPU time and peak RSS; the server stays in this process, so its work is
+# not counted. the results are written as JSON, and compared with an earlier run if one is given.
+# usage: python benchmarks/bench_download.py [--threads 4,16] [--chunk-sizes auto,40K] [--intervals auto,4M]
+#        [--resume off,on] [--sizes 16M,128M] [--bandwidth 100M] [--latency 0.02] [--per-connection 10M] [--repeat 3]
+#        [--output results.json] [--compare baseline.json] [--tolerance 0.1]
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from os.path import dirname, abspath, basename, join
+from time import perf_counter
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from range_server import RangeServer
+
+_ROOT = dirname(dirname(abspath(__file__)))
+_PACKAGE = basename(_ROOT)
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+_MATRIX = ('thread_count', 'chunk_size', 'min_insertion_interval', 'resume', 'size')
+_MATRIX_DEFAULTS = {'resume': False}  # of results written before the dimension existed
+_MEASURES = ('wall', 'cpu', 'peak_rss', 'throughput')
+
+
+def _parse_size(text):
+    """
+    :return: None for 'auto', else the number of bytes of e.g. '40960', '40K' or '1.5M'.
+    """
+    text = text.strip().upper()
+    if text == 'AUTO':
+        return None
+    unit = text[-1] if text[-1] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def _size_list(text):
+    return [_parse_size(x) for x in text.split(',')]
+
+
+def _switch_list(text):
+    switches = {'on': True, 'off': False}
+    values = [x.strip().lower() for x in text.split(',')]
+    if not set(values) <= set(switches):
+        raise argparse.ArgumentTypeError(f'expected on or off, got {text}')
+    return [switches[x] for x in values]
+
+
+def _fmt_size(n):
+    if n is None:
+        return 'auto'
+    for unit in ('G', 'M', 'K'):
+        if n >= _UNITS[unit] and n % _UNITS[unit] == 0:
+            return f'{n // _UNITS[unit]}{unit}'
+    return str(n)
+
+
+def _data(size):
+    return random.Random(size).randbytes(size)
+
+
+def _peak_rss():
+    """
+    :return: peak resident set size of this process in bytes, or None where the resource module is missing.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # kilobytes on Linux
+
+
+def _child(cell):
+    """
+    download one cell in this interpreter and print its measurements as one JSON line.
+    """
+    sys.path[:0] = [_ROOT, dirname(_ROOT)]
+    hsrequest = __import__(_PACKAGE)
+    import metrics
+
+    file_path = join(cell['folder'], 'file.bin')
+    cpu0, t0 = os.times(), perf_counter()
+    hsrequest.download_with_progress(file_path, cell['url'], thread_count=cell['thread_count'], headless=True,
+                                     debris_root=join(cell['folder'], 'debris'), resume=cell['resume'],
+                                     chunk_size=cell['chunk_size'],
+                                     min_insertion_interval=cell['min_insertion_interval'])
+    wall, cpu1 = perf_counter() - t0, os.times()
+
+    with open(file_path, 'rb') as f:
+        ok = hashlib.file_digest(f, 'sha256').hexdigest() == cell['sha256']
+    snapshot = metrics.registry.snapshot()
+    print(json.dumps({'wall': wall, 'cpu': (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system),
+                      'peak_rss': _peak_rss(), 'ok': ok,
+                      'splits': sum(s['value'] for s in snapshot['hsrequest_splits_total']),
+                      'retries': sum(s['value'] for s in snapshot['hsrequest_retries_total'])}))
+
+
+def _run_cell(cell, timeout):
+    folder = tempfile.mkdtemp(prefix='hsrequest-bench-')
+    try:
+        proc = subprocess.run([sys.executable, abspath(__file__), '--child', json.dumps({**cell, 'folder': folder})],
+                              capture_output=True, text=True, timeout=timeout)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'cell {cell} failed:\n{proc.stderr}')
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'commit': commit or None}
+
+
+def _run_matrix_cell(args, server, sha256, cell):
+    runs = []
+    for _ in range(args.repeat):
+        requests = server.requests
+        r = _run_cell({**cell, 'url': server.url, 'sha256': sha256}, args.timeout)
+        r['requests'] = server.requests - requests
+        r['throughput'] = cell['size'] / r['wall']
+        runs.append(r)
+    result = {**cell, 'runs': runs, 'ok': all(r['ok'] for r in runs)}
+    for m in _MEASURES:
+        values = [r[m] for r in runs if r[m] is not None]
+        result[m] = statistics.median(values) if values else None
+    print(f'{cell["thread_count"]:>4} threads  chunk {_fmt_size(cell["chunk_size"]):>5}  '
+          f'interval {_fmt_size(cell["min_insertion_interval"]):>5}  resume {"on" if cell["resume"] else "off":>3}  '
+          f'size {_fmt_size(cell["size"]):>5}  {result["throughput"] / _UNITS["M"]:8.1f}MiB/s  '
+          f'wall {result["wall"]:6.2f}s  cpu {result["cpu"]:6.2f}s  '
+          f'rss {(result["peak_rss"] or 0) / _UNITS["M"]:6.1f}MiB'
+          f'{"" if result["ok"] else "  CORRUPT"}')
+    return result
+
+
+def run(args):
+    results = []
+    for size in args.sizes:
+        data = _data(size)
+        sha256 = hashlib.sha256(data).hexdigest()
+        server = RangeServer(data, bandwidth=args.bandwidth, latency=args.latency,
+                             per_connection=args.per_connection).start_in_thread()
+        try:
+            for thread_count in args.threads:
+                for chunk_size in args.chunk_sizes:
+                    for interval in args.intervals:
+                        for resume in args.resume:
+                            results.append(_run_matrix_cell(args, server, sha256, {
+                                'thread_count': thread_count, 'chunk_size': chunk_size,
+                                'min_insertion_interval': interval, 'resume': resume, 'size': size}))
+        finally:
+            server.stop_thread()
+    return results
+
+
+def compare(report, baseline, tolerance):
+    """
+    print the cells whose median throughput or CPU time got worse than in baseline by more than tolerance.
+    :return: False if any did.
+    """
+    if report['server'] != baseline['server']:
+        print(f'the baseline was run against another server: {baseline["server"]}')
+    results = report['results']
+    key = lambda r: tuple(r.get(k, _MATRIX_DEFAULTS.get(k)) for k in _MATRIX)
+    before = {key(r): r for r in baseline['results']}
+    ok = True
+    for r in results:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        worse = []
+        if r['throughput'] < b['throughput'] * (1 - tolerance):
+            worse.append(f'throughput {b["throughput"] / _UNITS["M"]:.1f} -> {r["throughput"] / _UNITS["M"]:.1f}MiB/s')
+        if r['cpu'] > b['cpu'] * (1 + tolerance):
+            worse.append(f'cpu {b["cpu"]:.2f} -> {r["cpu"]:.2f}s')
+        if worse:
+            ok = False
+            print(f'regression at {dict(zip(_MATRIX, key(r)))}: {", ".join(worse)}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark download_with_progress against a local range server.')
+    parser.add_argument('--threads', type=lambda s: [int(x) for x in s.split(',')], default=[4, 16])
+    parser.add_argument('--chunk-sizes', type=_size_list, default=[None, 40960])
+    parser.add_argument('--intervals', type=_size_list, default=[None, 4096000])
+    parser.add_argument('--resume', type=_switch_list, default=[False],
+                        help='off,on: whether the downloaded ranges are journaled (fsync per segment), default off')
+    parser.add_argument('--sizes', type=_size_list, default=[16 * _UNITS['M'], 128 * _UNITS['M']])
+    parser.add_argument('--bandwidth', type=_parse_size, default=None, help='bytes/s of the server, default no limit')
+    parser.add_argument('--latency', type=float, default=0, help='seconds before every response')
+    parser.add_argument('--per-connection', type=_parse_size, default=None, help='bytes/s of each connection')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per cell; medians are reported')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds allowed per run')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative change counted as a regression')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(json.loads(args.child))
+        return True
+
+    results = run(args)
+    report = {'environment': _environment(),
+              'server': {'bandwidth': args.bandwidth, 'latency': args.latency, 'per_connection': args.per_connection},
+              'repeat': args.repeat, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    ok = all(r['ok'] for r in results)
+    if args.compare:
+        with open(args.compare) as f:
+            ok = compare(report, json.load(f), args.tolerance) and ok
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,59 @@
+#
+# Created on 2026/10/18.
+#
+# import-time benchmark of the package, each run in a fresh interpreter with python -X importtime.
+# reports the median cumulative import time of the package, the modules that cost most, and any GUI or server module
+# imported eagerly; exits with 1 if one is, or if the median exceeds the budget.
+# usage: python benchmarks/bench_import.py [runs] [budget in ms]
+import statistics
+import subprocess
+import sys
+from os.path import dirname, abspath, basename
+
+_ROOT = dirname(dirname(abspath(__file__)))
+_PACKAGE = basename(_ROOT)
+# only needed by the Tk window or the metrics endpoint; the import of the package must not pull them in.
+_LAZY = ('tkinter', 'interface', 'http.server')
+
+
+def _import_once():
+    """
+    :return: {module: (self us, cumulative us)} of one import of the package in a new interpreter.
+    """
+    code = f'import sys; sys.path[:0] = [{_ROOT!r}, {dirname(_ROOT)!r}]; import {_PACKAGE}'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main(runs, budget_ms):
+    totals = []
+    times = {}
+    for _ in range(runs):
+        times = _import_once()
+        totals.append(times[_PACKAGE][1] / 1000)
+    median = statistics.median(totals)
+    print(f'import {_PACKAGE}: median {median:.1f}ms, min {min(totals):.1f}ms over {runs} runs')
+    print('most expensive modules (self time of the last run):')
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda kv: -kv[1][0])[:15]:
+        print(f'  {name:<40} self {self_us / 1000:7.2f}ms  cumulative {cumulative_us / 1000:7.2f}ms')
+
+    ok = True
+    eager = [name for name in times if name in _LAZY]
+    if eager:
+        print(f'imported eagerly: {eager}')
+        ok = False
+    if budget_ms is not None and median > budget_ms:
+        print(f'over budget: {median:.1f}ms > {budget_ms}ms')
+        ok = False
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+                       float(sys.argv[2]) if len(sys.argv) > 2 else None) else 1)
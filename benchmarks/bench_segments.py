@@ -0,0 +1,80 @@
+#
+# Created on 2026/10/18.
+#
+# micro-benchmark of SegmentMap against the list-based _Progress it replaced.
+# usage: python benchmarks/bench_segments.py [segment counts...]
+import random
+import sys
+from os.path import dirname, abspath
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from segments import Segment, SegmentMap
+
+
+class _ListProgress(list):
+    """
+    the former _Progress: [[start,end,ongoing],...], with linear insertion and lookup by equality.
+    """
+
+    def ins(self, a):
+        for i in range(len(self)):
+            if a[0] < self[i][0]:
+                self.insert(i, a)
+                return
+        self.insert(len(self), a)
+
+    def get_next(self, a):
+        return self[self.index(a) + 1]
+
+    def largest_gap(self):
+        return max((self[i + 1][0] - self[i][1] for i in range(len(self) - 1)), default=0)
+
+
+def _bench(n, lookups, seed=0):
+    rnd = random.Random(seed)
+    size = n * 1000000
+    starts = rnd.sample(range(1, size), n)
+
+    res = {}
+    for name, new_map, new_seg, get_end, set_end in [
+        ('list', _ListProgress, lambda s: [s, s, True], lambda a: a[1], lambda a, v: a.__setitem__(1, v)),
+        ('SegmentMap', SegmentMap, lambda s: Segment(s, s, True), lambda a: a.end, lambda a, v: setattr(a, 'end', v)),
+    ]:
+        m = new_map()
+        m.ins(new_seg(0))
+        m.ins(new_seg(size))
+        t = perf_counter()
+        segs = []
+        for s in starts:
+            seg = new_seg(s)
+            m.ins(seg)
+            segs.append(seg)
+        t_ins = perf_counter() - t
+
+        picks = [rnd.choice(segs) for _ in range(lookups)]
+        t = perf_counter()
+        for seg in picks:  # what every worker does per chunk
+            nxt = m.get_next(seg)
+            set_end(seg, min(get_end(seg) + 1, nxt[0] if isinstance(nxt, list) else nxt.start))
+        t_next = perf_counter() - t
+
+        t = perf_counter()
+        for _ in range(100):
+            m.largest_gap()
+        t_gap = perf_counter() - t
+
+        res[name] = (t_ins / n * 1e6, t_next / lookups * 1e6, t_gap / 100 * 1e6)
+    return res
+
+
+def main(counts):
+    print(f'{"segments":>8} {"map":>10} {"ins us":>10} {"get_next us":>12} {"largest_gap us":>15}')
+    for n in counts:
+        for name, (t_ins, t_next, t_gap) in _bench(n, lookups=20000).items():
+            print(f'{n:>8} {name:>10} {t_ins:>10.3f} {t_next:>12.3f} {t_gap:>15.3f}')
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [16, 256, 1024, 4096])
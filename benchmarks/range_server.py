@@ -0,0 +1,189 @@
+#
+# Created on 2026/10/18.
+#
+# a local asyncio HTTP/1.1 server serving one in-memory file with Range/206 support, to run the engines against.
+# it can emulate a remote server: a latency before every response, a bandwidth shared by all connections, and a
+# throttle per connection like the one many servers put on each download.
+# usage: python benchmarks/range_server.py [size in bytes] [port] [bandwidth in B/s] [latency in s] [per connection B/s]
+import asyncio
+import os
+import re
+import sys
+import threading
+
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+_WRITE_SIZE = 256 * 1024
+_PACED_WRITE_SIZE = 16 * 1024  # smaller writes when throttled, so that the rate is smooth over short periods
+
+
+class _Pacer:
+    """
+    paces writes to rate bytes/s on average. like ratelimit.TokenBucket, a write is taken in advance and the next one
+    waits until it would have been sent, so writers are served in the order they came. used from the server loop only.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = 0.0  # loop time at which the next write may start
+
+    async def take(self, n):
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next)  # an idle period is not saved up for a burst
+        self._next = start + n / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class RangeServer:
+    """
+    serves `data` at every path but those of redirects. GET with a single byte range answers 206 with Content-Range,
+    otherwise 200. keep-alive is supported; a client may drop the connection at any point of a body.
+    """
+
+    def __init__(self, data: bytes, host='127.0.0.1', port=0, etag='"hsrequest-bench"', bandwidth=None, latency=0,
+                 per_connection=None, redirects=None):
+        """
+        :param bandwidth: bytes/s shared by all connections, or None for no limit.
+        :param latency: seconds between a request and its response headers.
+        :param per_connection: bytes/s of each connection, or None for no limit.
+        :param etag: sent with every response, or None for no validator at all.
+        :param redirects: {path: location} answered with 302 and a small html body, on the same keep-alive connection.
+        """
+        self.data = data
+        self.host = host
+        self.port = port
+        self.etag = etag
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.per_connection = per_connection
+        self.redirects = redirects or {}
+        self.requests = 0
+        self.connections = 0
+        self._pacer = None
+        self._server = None
+        self._handlers = {}  # task: writer
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/file.bin'
+
+    async def _send_body(self, writer, view, pacers):
+        step = _PACED_WRITE_SIZE if pacers else _WRITE_SIZE
+        for i in range(0, len(view), step):  # a client that stops reading must not make us buffer the whole file
+            piece = view[i:i + step]
+            for pacer in pacers:
+                await pacer.take(len(piece))
+            writer.write(piece)
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self._handlers[asyncio.current_task()] = writer
+        self.connections += 1
+        pacers = [p for p in (self._pacer, self.per_connection and _Pacer(self.per_connection)) if p]
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    k, _, v = line.decode('latin-1').partition(':')
+                    headers[k.strip().lower()] = v.strip()
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                location = self.redirects.get(request_line.split()[1].decode('latin-1'))
+                if location is not None:
+                    body = (f'<html>\r\n<head><title>302 Found</title></head>\r\n<body>\r\n'
+                            f'<a href="{location}">moved here</a>\r\n</body>\r\n</html>\r\n').encode('latin-1')
+                    writer.write(f'HTTP/1.1 302 Found\r\nLocation: {location}\r\nContent-Type: text/html\r\n'
+                                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+                    await writer.drain()
+                    continue
+
+                size = len(self.data)
+                start, end, status = 0, size - 1, '200 OK'
+                m = _RANGE_RE.match(headers.get('range', ''))
+                if m and (m.group(1) or m.group(2)):
+                    if m.group(1):
+                        start = int(m.group(1))
+                        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                    else:  # suffix range
+                        start = max(0, size - int(m.group(2)))
+                    if start >= size or start > end:
+                        writer.write(f'HTTP/1.1 416 Range Not Satisfiable\r\nContent-Range: bytes */{size}\r\n'
+                                     f'Content-Length: 0\r\n\r\n'.encode('latin-1'))
+                        await writer.drain()
+                        continue
+                    status = '206 Partial Content'
+                head = [f'HTTP/1.1 {status}', f'Content-Length: {end - start + 1}', 'Accept-Ranges: bytes',
+                        'Content-Type: application/octet-stream']
+                if self.etag is not None:
+                    head.append(f'ETag: {self.etag}')
+                if status.startswith('206'):
+                    head.append(f'Content-Range: bytes {start}-{end}/{size}')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if request_line.split()[0] != b'HEAD':
+                    await self._send_body(writer, memoryview(self.data)[start:end + 1], pacers)
+                else:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self):
+        """
+        start serving on the running event loop.
+        """
+        self._pacer = _Pacer(self.bandwidth) if self.bandwidth else None
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        handlers = dict(self._handlers)
+        for writer in handlers.values():  # idle keep-alive connections
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """
+        serve from an event loop in a daemon thread, for clients that are not asyncio-based.
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+async def _main(size, port, bandwidth, latency, per_connection):
+    server = await RangeServer(os.urandom(size), port=port, bandwidth=bandwidth, latency=latency,
+                               per_connection=per_connection).start()
+    print(f'serving {size}B at {server.url}')
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:] + [None] * 5
+    asyncio.run(_main(int(args[0] or 64 * 1024 * 1024), int(args[1] or 8000), args[2] and float(args[2]),
+                      float(args[3] or 0), args[4] and float(args[4])))
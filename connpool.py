@@ -0,0 +1,209 @@
+#
+# Created on 2026/10/18.
+#
+# process-wide connection reuse: one requests.Session per origin shared by every thread and download, with a DNS
+# cache and connections opened in parallel before the workers need them.
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from urllib.parse import urlsplit
+
+import requests
+import urllib3.util.connection
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+import tracing
+
+_logger = logging.getLogger('hsrequest_logger')
+
+
+class DNSCache:
+    """
+    (host, port, family) -> all addresses of host, kept for ttl seconds. a failed resolution is not cached.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # (host, port, family): (addresses, expiry)
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        """
+        :return: the addresses of host, in the order getaddrinfo gave them, which is the order to try them in.
+        """
+        key = (host, port, family)
+        now = monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        addresses = list(dict.fromkeys(sa[0] for *_, sa in socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)))
+        with self._lock:
+            self._entries[key] = (addresses, now + self.ttl)
+        return addresses
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+dns_cache = DNSCache()
+
+
+class _CachedDNSMixin:
+    def _new_conn(self):
+        # urllib3 connects to _dns_host; host (SNI, certificate, Host header) is derived from it, so it is only swapped
+        # for as long as the socket is being opened. like urllib3, every address of the allowed families is tried in
+        # turn, so that e.g. an unreachable IPv6 address falls back to the IPv4 one.
+        host = self._dns_host
+        try:
+            with tracing.span('dns', 'http', host=host):
+                addresses = dns_cache.resolve(host, self.port, urllib3.util.connection.allowed_gai_family())
+        except OSError:
+            addresses = []
+        addresses = addresses or [host]  # else let urllib3 resolve it again and raise its own error
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    with tracing.span('tcp connect', 'http', host=host, address=address):
+                        return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError):
+                    if i + 1 == len(addresses):
+                        raise
+        finally:
+            self._dns_host = host
+
+    # spans of the phases of a request. connect covers tcp connect and, for https, the tls handshake after it.
+    def connect(self):
+        with tracing.span('connect', 'http', host=self._dns_host):
+            return super().connect()
+
+    def request(self, method, url, *args, **kwargs):
+        with tracing.span('send', 'http', method=method):
+            return super().request(method, url, *args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        with tracing.span('first byte', 'http'):
+            return super().getresponse(*args, **kwargs)
+
+
+class _HTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class _TracedPoolMixin:
+    def _get_conn(self, *args, **kwargs):
+        with tracing.span('acquire', 'http', host=self.host):
+            return super()._get_conn(*args, **kwargs)
+
+
+class _HTTPConnectionPool(_TracedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(_TracedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _HTTPConnectionPool, 'https': _HTTPSConnectionPool}
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class SessionPool:
+    """
+    one requests.Session per origin (scheme://host:port), whose connection pool holds at least as many connections
+    as the most threads that ever asked for it. sessions live until close(); cookies are thus shared by all downloads
+    from one origin.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # origin: session
+        self._sizes = {}  # origin: pool size of its adapter
+        self._warm = {}  # origin: connections opened by prewarm
+
+    def session(self, url, size=1):
+        """
+        :param size: number of threads that are going to use the session at the same time.
+        """
+        origin = _origin(url)
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = self._sessions[origin] = requests.Session()
+                self._sizes[origin] = 0
+            if size > self._sizes[origin]:  # a larger pool is mounted; the old one goes with its last response
+                session.mount(origin + '/', _Adapter(pool_connections=1, pool_maxsize=size))
+                self._sizes[origin] = size
+                self._warm[origin] = 0
+            return session
+
+    def prewarm(self, url, count, timeout, kwargs=None):
+        """
+        open up to count connections to the origin of url in parallel, and leave them idle in its pool.
+        only the connections this origin has never been prewarmed with are opened. failures are only logged.
+        """
+        origin = _origin(url)
+        session = self.session(url, count)
+        with self._lock:
+            n = count - self._warm[origin]
+            self._warm[origin] = max(self._warm[origin], count)
+        if n <= 0:
+            return
+        kwargs = kwargs or {}
+        try:
+            settings = session.merge_environment_settings(url, kwargs.get('proxies') or {}, True,
+                                                          kwargs.get('verify'), kwargs.get('cert'))
+            if settings['proxies'] and requests.utils.select_proxy(url, settings['proxies']):
+                return  # connections go to the proxy
+            adapter = session.get_adapter(url)
+            req = requests.Request('GET', url).prepare()
+            if hasattr(adapter, 'get_connection_with_tls_context'):
+                pool = adapter.get_connection_with_tls_context(req, settings['verify'], None, settings['cert'])
+            else:  # requests < 2.32
+                pool = adapter.get_connection(url)
+                adapter.cert_verify(pool, url, settings['verify'], settings['cert'])
+        except (requests.RequestException, ValueError) as e:
+            _logger.error(f'prewarm: {url}: {e}')
+            return
+
+        def connect(_):
+            conn = pool._get_conn()
+            try:
+                if getattr(conn, 'sock', None) is None:  # not an idle connection already
+                    conn.timeout = timeout
+                    conn.connect()
+            except OSError as e:
+                _logger.error(f'prewarm: {origin}: {e}')
+                conn.close()
+            pool._put_conn(conn)
+
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            list(executor.map(connect, range(n)))
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._sizes.clear()
+            self._warm.clear()
+
+
+session_pool = SessionPool()
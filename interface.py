@@ -3,16 +3,27 @@
 #
 from __future__ import annotations
 
+import bisect
+from collections import deque
 from functools import wraps
+from itertools import islice
+from math import ceil
 from time import time
 from tkinter import *
 from tkinter.ttk import Separator, Treeview, Style
 from typing import Dict, AnyStr, List
 
-from Speedometer import Speedometer
+from Speedometer import Speedometer, SpeedAggregator
 from utils import *
 
 
+# kinds of events queued by worker threads
+_START = 0
+_PROGRESS = 1
+_FINALISE = 2
+_STATUS = 3
+
+
 def _timeit(func):  # for debug use
     def wrapper(*args, **kwargs):
         start = time()
@@ -198,6 +209,94 @@ class Interface(Tk):
         def de_highlight(self, label):
             self.change_color(label, self.NORMAL_COLOR)
 
+    class CoalescedProgressBar(MultiProgressBar):
+        """
+        a MultiProgressBar whose canvas items do not grow with the number of segments:
+        a thread has one rectangle (and one separator line) for its ongoing segment only. once finalised, a segment is
+        merged into the run of finished segments it touches at the current pixel width, so there are never more runs
+        than half the width in pixels. runs belong to no thread: only ongoing segments are highlighted.
+        all rectangles share one tooltip and one set of bindings. a progress only moves the rectangle of its thread,
+        and only if its right edge has moved by a pixel.
+        """
+
+        def __init__(self, size, master=None, **kwargs):
+            super().__init__(size, master, **kwargs)
+            self.active: Dict[AnyStr, List] = {}  # {label: [rect_id, line_id, from, to]}
+            self.run_starts: List[int] = []  # sorted starts of self.runs, for bisecting
+            self.runs: List[List[int]] = []  # [[from, to, rect_id], ...] of finished segments, disjoint and sorted
+            self.tag_bind('active', '<Enter>', self.on_hover)
+            self.tag_bind('active', '<Leave>', self.on_leave)
+            self.tooltip = self.ToolTip(self, 'active', '')
+
+        def _x(self, pos):
+            return int(pos / self.size * self.winfo_width()) if self.size else 0
+
+        def start(self, label, pos):
+            self.finalise(label)
+            x = self._x(pos)
+            h = self.winfo_height()
+            rect = self.create_rectangle(x, 0, x, h, fill=self.NORMAL_COLOR, outline='', tags=(label, 'active'),
+                                         stipple='gray50')
+            line = self.create_line(x, 0, x, h, fill='black')
+            self.active[label] = [rect, line, pos, pos]
+
+        def progress(self, label, amount):
+            entry = self.active[label]
+            entry[3] += amount
+            xl, yt, xr, yb = self.coords(entry[0])
+            x = self._x(entry[3])
+            if x != xr:
+                self.coords(entry[0], xl, yt, x, yb)
+
+        def finalise(self, label):
+            entry = self.active.pop(label, None)
+            if entry is None:
+                return
+            rect, line, start, end = entry
+            self.delete(line)
+            if start == end:
+                self.delete(rect)
+                return
+            self._add_run(start, end, rect)
+
+        def _add_run(self, start, end, rect):
+            # segments closer than a pixel are drawn as one run.
+            slack = self.size / max(self.winfo_width(), 1)
+            i = bisect.bisect_left(self.run_starts, start)
+            if i > 0 and self.runs[i - 1][1] + slack >= start:  # merge into the run on the left
+                self.delete(rect)
+                i -= 1
+                run = self.runs[i]
+                run[1] = max(run[1], end)
+            else:
+                self.itemconfig(rect, stipple='', tags=('done',))
+                run = [start, end, rect]
+                self.runs.insert(i, run)
+                self.run_starts.insert(i, start)
+            while i + 1 < len(self.runs) and self.runs[i + 1][0] <= run[1] + slack:  # swallow runs on the right
+                nxt = self.runs.pop(i + 1)
+                del self.run_starts[i + 1]
+                self.delete(nxt[2])
+                run[1] = max(run[1], nxt[1])
+            h = self.winfo_height()
+            self.coords(run[2], self._x(run[0]), 0, self._x(run[1]), h)
+
+        def on_hover(self, event=None):
+            items = self.find_withtag(CURRENT)
+            if items:
+                label = self.gettags(items[0])[0]
+                self.tooltip.text = label
+                self.highlight(label)
+
+        def on_leave(self, event=None):
+            items = self.find_withtag(CURRENT)
+            if items:
+                self.de_highlight(self.gettags(items[0])[0])
+
+        def change_color(self, label, color):
+            if label in self.active:
+                self.itemconfig(self.active[label][0], fill=color)
+
     class InfoEntry(Frame):
         def __init__(self, key, value=None, *args, **kwargs):
             super().__init__(*args, **kwargs)
@@ -382,6 +481,9 @@ class Interface(Tk):
         3
     ]
 
+    FRAME_MS = 40  # period of applying the events of worker threads to the interface
+    COALESCE_BAR = True  # draw the progress bar with CoalescedProgressBar, which scales to any number of segments
+
     # def after(self, ms, func=None, *args):
     #     ret = super().after(ms, func=func, *args)
     #     self.after_ids[func.__name__] = ret
@@ -393,7 +495,11 @@ class Interface(Tk):
     #         self.after_cancel(self.after_ids[each])
 
     # draw interface
-    def __init__(self, url, headers, path, size, **kwargs):
+    def __init__(self, url, headers, path, size, speed: SpeedAggregator = None, **kwargs):
+        """
+        :param speed: the aggregated speed of the download, which its threads submit to. if not given, the interface
+        keeps its own and submits the progress it receives.
+        """
         super().__init__(**kwargs)
 
         self.url = url
@@ -402,12 +508,16 @@ class Interface(Tk):
         self.size = size
         self.downloaded_sizes: Dict[AnyStr, int] = {}  # downloaded sizes of respective threads
         self.total_downloaded = 0
-        self.speedometers: Dict[AnyStr, Speedometer] = {}
-        self.cached_current_speeds = {}  # cache data from speedometers
+        self.speedometers: Dict[AnyStr, Speedometer] = {}  # per thread, for the chart only
+        self.own_speed = speed is None
+        self._events = deque()  # (kind, label, argument) from worker threads, drained by the Tk thread every frame
+        self.speed = SpeedAggregator() if speed is None else speed
 
         self.statuses: Dict[AnyStr, AnyStr] = {}
         self.start_time = time()
-        self.registered_labels = []
+        self.registered_labels: Dict[AnyStr, None] = {}  # in order of registration
+        self.chart_cells: Dict[AnyStr, Dict[AnyStr, AnyStr]] = {}  # {label: {column: text shown}} of inserted rows
+        self.dirty_labels = set()  # labels whose size or status changed since their row was last rendered
 
         # self.after_ids = {}
 
@@ -445,7 +555,8 @@ class Interface(Tk):
 
         ############
         Label(self, text='Progress:').grid(sticky='w', padx=18)
-        self.bar = self.MultiProgressBar(self.size, self, borderwidth=1, relief=SUNKEN)
+        bar_class = self.CoalescedProgressBar if self.COALESCE_BAR else self.MultiProgressBar
+        self.bar = bar_class(self.size, self, borderwidth=1, relief=SUNKEN)
         self.bar.grid(sticky='ew', padx=13)
         self.bar.update()  # todo: why need this??
 
@@ -467,7 +578,8 @@ class Interface(Tk):
                               width=int((frm.winfo_width() - sb.winfo_width()) / total_w * self.column_widths_w[i]),
                               anchor=CENTER)
             self.chart.heading(f'#{i}', text=label,
-                               command=lambda col=f'#{i}': treeview_sort_column(self.chart, col, False))
+                               command=lambda col=f'#{i}': treeview_sort_column(self.chart, col, False,
+                                                                               before=self._render_all_rows))
             # Note: command=lambda _x=x: func(_x) is not equivalent to command=lambda: func(x).
             # see https://stackoverflow.com/questions/1966929/tk-treeview-column-sort
 
@@ -491,8 +603,8 @@ class Interface(Tk):
         self.after(0, self._update_average_speed)
         self.after(0, self._update_time_used)
         self.after(0, self._update_time_left)
-        self.after(0, self._cache_current_speeds)
         self.after(0, self._update_chart)
+        self.after(0, self._drain_events)
 
     # a decorator registering new labels passed in
     # https://stackoverflow.com/questions/47953245/decorator-inside-a-class-throw-warning-in-pycharm
@@ -501,8 +613,8 @@ class Interface(Tk):
         # def wrapper(self: >>Interface<<, label, *args, **kwargs):
         # https://stackoverflow.com/questions/33533148/how-do-i-type-hint-a-method-with-the-type-of-the-enclosing-class
         def wrapper(self: Interface, label, *args, **kwargs):
-            if label not in self.registered_labels:
-                self.registered_labels.append(label)
+            self.registered_labels.setdefault(label)
+            self.dirty_labels.add(label)
             return func(self, label, *args, **kwargs)
 
         return wrapper
@@ -538,7 +650,7 @@ class Interface(Tk):
     @_circular_call(500, 'bef')
     @_timeit
     def _update_total_current_speed(self):
-        total_current_speed = sum(self.cached_current_speeds.values()) * 1000
+        total_current_speed = self.speed.cur_speed(instant_ms=1973) * 1000
         self.lbls_info['current speed'].set(_fmt_size(total_current_speed) + '/s')
 
     @_circular_call(500, 'bef')
@@ -559,7 +671,7 @@ class Interface(Tk):
     @_circular_call(500, 'bef')
     @_timeit
     def _update_time_left(self):
-        total_current_speed = sum(self.cached_current_speeds.values()) * 1000
+        total_current_speed = self.speed.cur_speed(instant_ms=1973) * 1000
         if total_current_speed == 0:
             return
         time_left = (self.size - self.total_downloaded) / total_current_speed
@@ -567,32 +679,81 @@ class Interface(Tk):
 
     @_circular_call(500, 'bef')
     @_timeit
-    def _cache_current_speeds(self):
-        for label in self.speedometers:
-            self.cached_current_speeds[label] = self.speedometers[label].cur_speed(instant_ms=1973)
+    def _update_chart(self):
+        self._render_chart()
+
+    def _render_all_rows(self):
+        self._render_chart(all_rows=True)  # e.g. so that rows are sorted by what they would show
+
+    def _render_chart(self, all_rows=False):
+        """
+        append the rows of new labels, then render the visible rows only (or all of them), and set only the cells
+        whose text has changed. a row that is not visible keeps its old text, and stays dirty until it is rendered.
+        """
+        for label in islice(self.registered_labels, len(self.chart_cells), None):  # registered_labels only grows
+            self.chart.insert('', END, iid=label, text=label)
+            self.chart_cells[label] = {}
+        rows = self.chart.get_children('')  # in the order shown, which sorting may have changed
+        if not all_rows:
+            top, bottom = self.chart.yview()
+            rows = rows[int(top * len(rows)):ceil(bottom * len(rows))]
+        for label in rows:
+            cells = self.chart_cells[label]
+            texts = {}
+            speedometer = self.speedometers.get(label)
+            if speedometer is not None:
+                texts['Speed'] = _fmt_size(speedometer.cur_speed(instant_ms=1973) * 1000) + '/s'
+            if label in self.dirty_labels:
+                self.dirty_labels.discard(label)
+                if label in self.downloaded_sizes:
+                    texts['Downloaded Size'] = _fmt_size(self.downloaded_sizes[label])
+                if label in self.statuses:
+                    texts['Status'] = self.statuses[label]
+            for column, text in texts.items():
+                if cells.get(column) != text:
+                    self.chart.set(label, column, text)
+                    cells[column] = text
+
+    # observer methods, called by worker threads: they only append an event, and never touch Tk or any other state.
+    # deque.append and popleft are atomic, so no lock is needed either.
+    def start(self, label, pos):
+        self._events.append((_START, label, pos))
 
-    @_circular_call(500, 'bef')
+    def progress(self, label, amount):
+        self._events.append((_PROGRESS, label, amount))
+
+    def finalise(self, label):
+        self._events.append((_FINALISE, label, None))
+
+    def submit_status(self, label, status):
+        self._events.append((_STATUS, label, status))
+
+    @_circular_call(FRAME_MS, 'bef')
     @_timeit
-    def _update_chart(self):
-        for label in self.registered_labels:
-            if label not in self.chart.get_children(''):
-                self.chart.insert('', END, iid=label, text=label)
-            try:
-                self.chart.set(label, 'Speed', _fmt_size(self.cached_current_speeds[label] * 1000) + '/s')
-            except KeyError:
-                pass
-            try:
-                self.chart.set(label, 'Downloaded Size', _fmt_size(self.downloaded_sizes[label]))
-            except KeyError:
-                pass
-            try:
-                self.chart.set(label, 'Status', self.statuses[label])
-            except KeyError:
-                pass
+    def _drain_events(self):
+        """
+        apply the events queued since the last frame, on the Tk thread. the progress of each thread is summed up and
+        applied once per frame; the order of events of one thread is kept.
+        """
+        amounts: Dict[AnyStr, int] = {}  # summed progress not applied yet
+        for _ in range(len(self._events)):  # no more than were queued at the start of the frame
+            kind, label, arg = self._events.popleft()
+            if kind == _PROGRESS:
+                amounts[label] = amounts.get(label, 0) + arg
+                continue
+            if label in amounts:
+                self._on_progress(label, amounts.pop(label))
+            if kind == _START:
+                self._on_start(label, arg)
+            elif kind == _FINALISE:
+                self._on_finalise(label)
+            else:
+                self._on_status(label, arg)
+        for label, amount in amounts.items():
+            self._on_progress(label, amount)
 
     @_register_label
-    @_timeit
-    def start(self, label, pos):
+    def _on_start(self, label, pos):
         if label not in self.downloaded_sizes:
             self.downloaded_sizes[label] = 0
         if label not in self.speedometers:
@@ -600,24 +761,24 @@ class Interface(Tk):
 
         self.bar.start(label, pos)
 
-    @_timeit
-    def progress(self, label, amount):  # todo make this function O(1), or the interface lags like shit. (done.)
+    def _on_progress(self, label, amount):
         self.downloaded_sizes[label] += amount
+        self.dirty_labels.add(label)
         self.total_downloaded += amount
 
         self.bar.progress(label, amount)
 
         self.speedometers[label].submit(amount, cumulative=False)
         # self.speedometers[label].submit(self.downloaded_sizes[label], cumulative=True)
+        if self.own_speed:
+            self.speed.submit(amount)
 
     @_register_label
-    @_timeit
-    def finalise(self, label):
+    def _on_finalise(self, label):
         self.bar.finalise(label)
 
     @_register_label
-    @_timeit
-    def submit_status(self, label, status):
+    def _on_status(self, label, status):
         self.statuses[label] = status
 
     # @_register_label
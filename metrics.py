@@ -0,0 +1,245 @@
+#
+# Created on 2026/10/18.
+#
+# metrics of the download engine, readable as a dict (registry.snapshot()) or in the Prometheus text format, e.g.
+# from a local /metrics endpoint (start_http_server).
+import threading
+from math import inf
+from typing import Dict, List, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+def _fmt_value(v):
+    return '+Inf' if v == inf else repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, '_Metric'] = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered.')
+            self._metrics[metric.name] = metric
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """
+        :return: {name: [{'labels': {label: value}, 'value': value}, ...]}. the value of a histogram is
+        {'buckets': {upper bound: cumulative count}, 'sum': float, 'count': int}.
+        """
+        return {m.name: [{'labels': dict(zip(m.labelnames, values)), 'value': value} for values, value in m.samples()]
+                for m in self.metrics()}
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for m in self.metrics():
+            lines.append(f'# HELP {m.name} {m.help}')
+            lines.append(f'# TYPE {m.name} {m.type}')
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class _Metric:
+    """
+    a family of time series, one per combination of label values. a series is created by labels() on first use.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=registry):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        :return: the series of the label values, to be kept by a caller that updates it often.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} has labels {self.labelnames}, got {values}.')
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> List[Tuple[tuple, object]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [(values, child.get()) for values, child in children]
+
+    def render(self):
+        return [f'{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_value(value)}'
+                for values, value in self.samples()]
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)  # per bucket, not cumulative
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = 0
+        while value > self.bounds[i]:  # the last bound is inf
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def get(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'buckets': buckets, 'sum': total, 'count': cumulative}
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=registry):
+        self.bounds = tuple(sorted(buckets)) + (inf,)
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = []
+        for values, value in self.samples():
+            for bound, count in value['buckets'].items():
+                lines.append(f'{self.name}_bucket{_fmt_labels(self.labelnames, values, [("le", _fmt_value(bound))])} '
+                             f'{count}')
+            labels = _fmt_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_fmt_value(value["sum"])}')
+            lines.append(f'{self.name}_count{labels} {value["count"]}')
+        return lines
+
+
+# metrics fed by the engine. host is the netloc of a url; worker is the label of a thread.
+bytes_received = Counter('hsrequest_bytes_received_total', 'Bytes received, per host and worker thread.',
+                         ('host', 'worker'))
+active_connections = Gauge('hsrequest_active_connections', 'Segments being requested or received.', ('host',))
+splits = Counter('hsrequest_splits_total', 'Segments started at a point found by the split policy.', ('host',))
+retries = Counter('hsrequest_retries_total', 'Segments interrupted by an error, whose rest is downloaded again.',
+                  ('host',))
+ttfb = Histogram('hsrequest_ttfb_seconds', 'Time from sending a range request to its response headers.', ('host',))
+merge_duration = Histogram('hsrequest_merge_duration_seconds', 'Time to merge the data of a download into its file.',
+                           buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+standby_seconds = Counter('hsrequest_standby_seconds_total', 'Time worker threads spent standing by for a segment.',
+                          ('host',))
+
+
+def start_http_server(port=9464, addr='127.0.0.1', registry=registry):
+    """
+    serve registry at http://addr:port/metrics from a daemon thread.
+    :return: the server; call its shutdown() to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only for those who serve
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
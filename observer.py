@@ -0,0 +1,81 @@
+#
+# Created on 2026/10/18.
+#
+import threading
+from time import monotonic
+from typing import Dict, AnyStr, Callable, Optional
+
+
+class ProgressObserver:
+    """
+    receives progress events from download threads. every method is a no-op, so a download started with a bare
+    ProgressObserver does no UI work at all (headless mode).
+    label is the str id of a thread; pos and amount are in bytes.
+    methods are called from worker threads - subclasses must be thread-safe.
+    """
+
+    def submit_status(self, label, status):
+        pass
+
+    def start(self, label, pos):
+        pass
+
+    def progress(self, label, amount):
+        pass
+
+    def finalise(self, label):
+        pass
+
+    def close(self):
+        pass
+
+
+class CallbackObserver(ProgressObserver):
+    """
+    collects progress and passes a snapshot to callback at most once every interval seconds,
+    plus once more on close(). the snapshot is a dict:
+    {'size': int, 'downloaded': int, 'workers': {label: {'status': str, 'downloaded': int}, ...}}
+    """
+
+    def __init__(self, callback: Callable[[dict], None], size: Optional[int] = None, interval=0.5):
+        self.callback = callback
+        self.size = size
+        self.interval = interval
+        self.downloaded_sizes: Dict[AnyStr, int] = {}  # each label is only written by its own thread
+        self.statuses: Dict[AnyStr, AnyStr] = {}
+        self._next_call = monotonic() + interval
+        self._call_lock = threading.Lock()  # only taken when a callback is due, never per chunk
+
+    def snapshot(self):
+        downloaded_sizes = dict(self.downloaded_sizes)
+        statuses = dict(self.statuses)
+        return {
+            'size': self.size,
+            'downloaded': sum(downloaded_sizes.values()),
+            'workers': {label: {'status': statuses.get(label), 'downloaded': downloaded_sizes.get(label, 0)}
+                        for label in {*downloaded_sizes, *statuses}},
+        }
+
+    def _maybe_call(self):
+        if monotonic() < self._next_call or not self._call_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_call = monotonic() + self.interval
+            self.callback(self.snapshot())
+        finally:
+            self._call_lock.release()
+
+    def submit_status(self, label, status):
+        self.statuses[label] = status
+        self._maybe_call()
+
+    def start(self, label, pos):
+        self.downloaded_sizes.setdefault(label, 0)
+
+    def progress(self, label, amount):
+        self.downloaded_sizes[label] += amount
+        self._maybe_call()
+
+    def close(self):
+        with self._call_lock:
+            self.callback(self.snapshot())
@@ -0,0 +1,98 @@
+#
+# Created on 2026/10/18.
+#
+import threading
+from time import monotonic, sleep
+
+_LEASE_TIME = 0.02  # a lease covers this long at the full rate, so the lock of a bucket is rarely taken
+_UNLIMITED_LEASE = 1048576  # bytes a thread goes on with before it looks again whether a limit has been set
+_KEEP = object()  # default of the parameters of TokenBucket.set: leave the setting as it is
+
+
+class TokenBucket:
+    """
+    a token bucket shared by any number of threads: rate tokens (bytes) per second flow in, up to burst tokens are kept.
+    rate None means unlimited; a rate of 0 is not a limit but an error. rate and burst can be changed at any time with
+    set().
+    tokens are taken in advance and may run into debt; the taker then sleeps, without holding the lock, until the debt
+    would have been paid back. so takers are served in the order they came, and a large take never starves.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate: bytes/s, or None for no limit.
+        :param burst: bytes that may be taken at once after an idle period, or None for one second at rate.
+        """
+        self._lock = threading.Lock()
+        self.rate = None
+        self.burst = None
+        self._burst = None  # as given: None follows rate
+        self._tokens = 0
+        self._t = monotonic()
+        self.set(rate, burst)
+        self._tokens = self.burst  # start full
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def set(self, rate=_KEEP, burst=_KEEP):
+        """
+        change rate and/or burst, meaning the same as in __init__. a parameter not given is left as it is.
+        """
+        if rate is not _KEEP and rate is not None and not rate > 0:
+            raise ValueError(f'rate must be positive, or None for no limit; got {rate}.')
+        if burst is not _KEEP and burst is not None and not burst > 0:
+            raise ValueError(f'burst must be positive, or None for one second at rate; got {burst}.')
+        with self._lock:
+            self._refill(monotonic())  # tokens so far flowed in at the old rate
+            if rate is not _KEEP:
+                self.rate = rate
+            if burst is not _KEEP:
+                self._burst = burst
+            self.burst = max(self._burst if self._burst is not None else (self.rate or 0), 1)
+            self._tokens = min(self._tokens, self.burst)
+
+    def lease_size(self):
+        rate = self.rate
+        return _UNLIMITED_LEASE if rate is None else max(1, min(int(rate * _LEASE_TIME), self.burst // 4))
+
+    def take(self, n):
+        """
+        take n tokens without waiting.
+        :return: seconds the caller should sleep before using them.
+        """
+        if self.rate is None:
+            return 0
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            self._tokens -= n
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def __repr__(self):
+        return f'TokenBucket(rate={self.rate}, burst={self.burst})'
+
+
+global_limiter = TokenBucket()  # process-wide limit of all downloads, unlimited unless set
+
+
+class Lease:
+    """
+    tokens taken in advance by one thread from all of its buckets at once, so that a chunk only costs a subtraction,
+    and the locks of the buckets are taken once per lease.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = [b for b in buckets if b is not None]
+        self.balance = 0
+
+    def consume(self, n):
+        self.balance -= n
+        if self.balance < 0:
+            need = max(-self.balance, min((b.lease_size() for b in self.buckets), default=_UNLIMITED_LEASE))
+            wait = max((b.take(need) for b in self.buckets), default=0)
+            self.balance += need
+            if wait > 0:
+                sleep(wait)
@@ -0,0 +1,254 @@
+#
+# Created on 2026/10/18.
+#
+import heapq
+from bisect import bisect_left, bisect_right
+from itertools import count, islice
+from random import choice
+from time import monotonic
+
+
+class Segment:
+    """
+    [start, end) has downloaded.
+    ongoing==True: end may extend (download process for this segment has not finished). Other threads should not start
+    straight at end.
+    ongoing==False: end will no longer extend (download process for this segment has finished). Feel free to start
+    right at end.
+    stop_at: start of the next segment, i.e. where the owner of this segment must stop. it is only changed by SegmentMap
+    (under the caller's lock) when a segment is inserted right after this one or removed, so the owner can read it per
+    chunk without locking. a split aims at least min_insertion_interval / 2 away from the owner, and the caller rejects
+    it if the owner has meanwhile got within a chunk of it, so a chunk read just before the update can never overrun it.
+    t_start: monotonic time when the owner started receiving data, or None before that. used to measure its speed.
+    """
+    __slots__ = ('start', 'end', 'ongoing', 'removed', 'stop_at', 't_start')
+
+    def __init__(self, start, end, ongoing):
+        self.start = start
+        self.end = end
+        self.ongoing = ongoing
+        self.removed = False
+        self.stop_at = end
+        self.t_start = None
+
+    def speed(self, now=None):
+        """
+        :return: average speed since the owner started receiving, in bytes/s, or None if not measured yet.
+        """
+        if self.t_start is None:
+            return None
+        dur = (monotonic() if now is None else now) - self.t_start
+        return (self.end - self.start) / dur if dur > 0 else None
+
+    def __repr__(self):
+        return f'[{self.start}, {self.end}, {self.ongoing}]'
+
+
+class SegmentMap:
+    """
+    segments sorted by start. positions are found by bisecting a plain list of starts, so lookups are O(logn) and an
+    insertion is a bisect plus a memmove of pointers. the largest gap is kept in a lazy max-heap: gaps only shrink
+    while segments grow, so a heap key is always an upper bound of its gap and is re-validated when it reaches the top.
+    segments are identified by object, so two segments may share a start (e.g. an empty sentinel and a new segment).
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._segs = []
+        self._gaps = []  # max-heap of (-gap, tie breaker, segment before the gap)
+        self._tie = count()
+
+    def __len__(self):
+        return len(self._segs)
+
+    def __iter__(self):
+        return iter(self._segs)
+
+    def __getitem__(self, i):
+        return self._segs[i]
+
+    def pairs(self):
+        """
+        :return: an iterator of (segment, next segment).
+        """
+        return zip(self._segs, islice(self._segs, 1, None))
+
+    def __repr__(self):
+        return 'SegmentMap' + repr(self._segs)
+
+    def clear(self):
+        for seg in self._segs:
+            seg.removed = True
+        self._starts.clear()
+        self._segs.clear()
+        self._gaps.clear()
+
+    def _index(self, seg):
+        i = bisect_left(self._starts, seg.start)
+        while self._segs[i] is not seg:  # only loops over segments sharing the same start
+            i += 1
+        return i
+
+    def _push_gap(self, i):
+        if i + 1 < len(self._segs):
+            gap = self._segs[i + 1].start - self._segs[i].end
+            if gap > 0:
+                heapq.heappush(self._gaps, (-gap, next(self._tie), self._segs[i]))
+
+    def ins(self, seg):
+        """
+        O(logn) + memmove. seg is placed after the segments starting at the same position.
+        """
+        i = bisect_right(self._starts, seg.start)
+        self._starts.insert(i, seg.start)
+        self._segs.insert(i, seg)
+        seg.removed = False
+        seg.stop_at = self._segs[i + 1].start if i + 1 < len(self._segs) else seg.end
+        if i > 0:
+            self._segs[i - 1].stop_at = seg.start
+        self._push_gap(i)
+        if i > 0 and i + 1 == len(self._segs):
+            self._push_gap(i - 1)  # a gap has just appeared before seg; any other gap before a new seg only shrinks
+
+    def remove(self, seg):
+        i = self._index(seg)
+        del self._starts[i]
+        del self._segs[i]
+        seg.removed = True
+        if i > 0:
+            self._segs[i - 1].stop_at = seg.stop_at
+            self._push_gap(i - 1)  # the gap before seg has merged with the gap after it
+
+    def get_next(self, seg):
+        return self._segs[self._index(seg) + 1]
+
+    def get_prev(self, seg):
+        i = self._index(seg)
+        return self._segs[i - 1] if i > 0 else None
+
+    def find_le(self, pos):
+        """
+        :return: the last segment starting at or before pos, or None.
+        """
+        i = bisect_right(self._starts, pos)
+        return self._segs[i - 1] if i else None
+
+    def gap_after(self, seg):
+        i = self._index(seg)
+        return self._segs[i + 1].start - seg.end if i + 1 < len(self._segs) else 0
+
+    def largest_gap(self):
+        """
+        amortised O(logn).
+        :return: (gap, segment before the gap), or (0, None) if there is no gap.
+        """
+        while self._gaps:
+            neg_gap, _, seg = self._gaps[0]
+            if seg.removed:
+                heapq.heappop(self._gaps)
+                continue
+            gap = self.gap_after(seg)
+            if gap == -neg_gap:
+                return gap, seg
+            heapq.heappop(self._gaps)
+            if gap > 0:
+                heapq.heappush(self._gaps, (-gap, next(self._tie), seg))
+        return 0, None
+
+    # find another point to start after thread finishes downloading, as decided by policy (default split_random).
+    # return -1: Stand by; -2: All finished; other non-neg values: pos to insert at.
+    def find_insert_pt(self, min_insertion_interval, policy=None):
+        return (policy or split_random)(self, min_insertion_interval)
+
+
+# split policies: f(progress, min_insertion_interval) -> pos to insert at, or -1 (Stand by), or -2 (All finished).
+# a gap after a finished segment (nobody is downloading it) can be started right at its start;
+# a gap after an ongoing segment is only split if it is larger than min_insertion_interval,
+# and the split point always keeps min_insertion_interval // 2 away from the owner (see Segment.stop_at).
+
+def _split_at(seg, nxt, min_insertion_interval, pos):
+    half = min_insertion_interval // 2
+    return min(max(pos, seg.end + half), nxt.start - half)
+
+
+def split_random(progress, min_insertion_interval):
+    """
+    O(n). pick any candidate gap at random, and split an ongoing one at its midpoint.
+    """
+    code = -2
+    pos = []
+    for seg, nxt in progress.pairs():
+        span = nxt.start - seg.end
+        if code == -2 and span > 0:
+            code = -1
+        if seg.ongoing and span > min_insertion_interval:
+            pos.append((nxt.start + seg.end) // 2)
+        elif not seg.ongoing and span > 0:
+            pos.append(seg.end)
+    return choice(pos) if len(pos) != 0 else code
+
+
+def split_largest(progress, min_insertion_interval):
+    """
+    amortised O(logn) unless the largest gap cannot be split. take the largest remaining gap, at its midpoint.
+    """
+    gap, seg = progress.largest_gap()
+    if seg is None:
+        return -2
+    if not seg.ongoing:
+        return seg.end
+    if gap > min_insertion_interval:
+        return (seg.end + seg.stop_at) // 2
+    # the largest gap is still too small to split; a smaller gap may have been left behind by a finished thread though.
+    best = None
+    for s, nxt in progress.pairs():
+        span = nxt.start - s.end
+        if not s.ongoing and span > 0 and (best is None or span > best[0]):
+            best = (span, s.end)
+    return best[1] if best is not None else -1
+
+
+def split_eta(progress, min_insertion_interval):
+    """
+    O(n). take the gap that would be finished last at the measured speed of its owner, and split it so that the owner
+    and the new thread are expected to finish at the same time. the new thread is assumed to be as fast as the average
+    owner of a splittable gap. gaps without an owner come first, then gaps whose owner has no measured speed yet (largest first).
+    """
+    now = monotonic()
+    candidates = []  # (seg, next seg, span, speed of seg)
+    code = -2
+    speed_sum, speed_n = 0, 0
+    for seg, nxt in progress.pairs():
+        span = nxt.start - seg.end
+        if span <= 0:
+            continue
+        code = -1
+        if not seg.ongoing:
+            candidates.append((seg, nxt, span, None))
+        elif span > min_insertion_interval:
+            v = seg.speed(now)
+            if v:
+                speed_sum += v
+                speed_n += 1
+            candidates.append((seg, nxt, span, v))
+    ave_speed = speed_sum / speed_n if speed_n else None
+
+    best_key, best_pos = None, None
+    for seg, nxt, span, v in candidates:
+        if not seg.ongoing:
+            key, pos = (2, span), seg.end
+        elif not v or ave_speed is None:
+            key, pos = (1, span), (seg.end + nxt.start) // 2
+        else:
+            key = (0, span / v)
+            pos = _split_at(seg, nxt, min_insertion_interval, seg.end + int(span * v / (v + ave_speed)))
+        if best_key is None or key > best_key:
+            best_key, best_pos = key, pos
+    return best_pos if best_pos is not None else code
+
+
+SPLIT_POLICIES = {
+    'random': split_random,
+    'largest': split_largest,
+    'eta': split_eta,
+}
@@ -0,0 +1,296 @@
+#
+# Created on 2026/10/18.
+#
+import errno
+import json
+import os
+import shutil
+import sys
+import threading
+from os import listdir, makedirs
+from os.path import join, exists
+
+_JOURNAL_NAME = 'journal.json'
+
+
+def _read_journal(path, key):
+    """
+    :return: the ranges [(start, end), ...] recorded for key, or None if there is no valid journal of key at path.
+    """
+    try:
+        with open(path, 'r') as f:
+            record = json.load(f)
+        if record['key'] != key:
+            return None
+        return [(int(start), int(end)) for start, end in record['segments']]
+    except (OSError, ValueError, KeyError, TypeError):  # missing, or torn by an older version without atomic writes
+        return None
+
+
+def _write_journal(path, key, segments):
+    """
+    replace the journal at path atomically: a crash leaves either the old journal or the new one, never a torn one.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'key': key, 'segments': segments}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _SegmentWriter:
+    """
+    writes one segment at its own offset of a shared file descriptor, so segments never need to be merged.
+    """
+
+    def __init__(self, fd, start):
+        self.fd = fd
+        self.offset = start
+        self.written = 0
+
+    def write(self, data):
+        n = os.pwrite(self.fd, data, self.offset)
+        self.offset += n
+        self.written += n
+        return n
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _SeekingSegmentWriter(_SegmentWriter):
+    """
+    fallback of _SegmentWriter for platforms without os.pwrite (i.e. Windows): one file object per segment.
+    """
+
+    def __init__(self, path, start):
+        super().__init__(None, start)
+        self.f = open(path, 'r+b')
+        self.f.seek(start)
+
+    def write(self, data):
+        n = self.f.write(data)
+        self.written += n
+        return n
+
+    def close(self):
+        self.f.close()
+
+
+class DebrisStorage:
+    """
+    every segment is written to its own debris file <debris_dir>/<start>; the debris files are merged at the end.
+    """
+
+    def __init__(self, debris_dir):
+        self.debris_dir = debris_dir
+        self.journal_path = join(debris_dir, _JOURNAL_NAME)
+
+    def prepare(self, key=None):
+        """
+        :param key: identity of the content. if the journal left in debris_dir by an earlier run has the same key,
+        the debris recorded in it are kept; otherwise debris_dir is cleaned up.
+        :return: the ranges [(start, end), ...] that are already downloaded.
+        """
+        done = _read_journal(self.journal_path, key) if key is not None else None
+        if done is None:
+            if exists(self.debris_dir):
+                shutil.rmtree(self.debris_dir)  # clean up first
+            makedirs(self.debris_dir, exist_ok=True)
+            return []
+
+        kept = {}
+        for start, end in done:
+            try:  # a debris may be shorter than recorded if it was still buffered when the journal was written
+                end = min(end, start + os.stat(join(self.debris_dir, f'{start}')).st_size)
+            except OSError:
+                continue
+            if end > start:
+                kept[f'{start}'] = (start, end)
+        for name in listdir(self.debris_dir):
+            if name in kept:
+                start, end = kept[name]
+                os.truncate(join(self.debris_dir, name), end - start)  # debris are concatenated as a whole
+            elif name != _JOURNAL_NAME:
+                os.remove(join(self.debris_dir, name))
+        return sorted(kept.values())
+
+    def open_segment(self, start):
+        return open(join(self.debris_dir, f'{start}'), 'wb')
+
+    def save(self, key, segments):
+        """
+        record the downloaded ranges [(start, end), ...] under key. the debris are synced first, so after a power
+        loss every recorded byte is either on disk or cut off by the length of its debris.
+        """
+        for name in listdir(self.debris_dir):
+            if name.isdigit():
+                try:
+                    _fsync_path(join(self.debris_dir, name))
+                except FileNotFoundError:
+                    pass
+        _write_journal(self.journal_path, key, segments)
+
+    def finish(self, final_path):
+        """
+        :return: the total size written to final_path.
+        """
+        return _merge_debris(self.debris_dir, final_path)
+
+    def cleanup(self):
+        shutil.rmtree(self.debris_dir)
+
+
+class DirectStorage:
+    """
+    the destination is preallocated to its full size and every segment is written straight to its own offset,
+    so each byte hits the disk once and no merge is needed.
+    """
+
+    def __init__(self, file_path, size):
+        self.file_path = file_path
+        self.size = size
+        self.fd = None
+        self.writers = []
+        self.journal_path = file_path + '.' + _JOURNAL_NAME
+        self.resumed = 0  # bytes downloaded by an earlier run
+
+    def prepare(self, key=None):
+        """
+        :param key: identity of the content. if the journal left beside file_path by an earlier run has the same key,
+        the content of file_path is kept; otherwise file_path is truncated.
+        :return: the ranges [(start, end), ...] that are already downloaded.
+        """
+        done = None
+        if key is not None and exists(self.file_path) and os.stat(self.file_path).st_size == self.size:
+            done = _read_journal(self.journal_path, key)
+        if done is not None:
+            self.fd = os.open(self.file_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+            self.resumed = sum(end - start for start, end in done)
+            return done
+
+        self.fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+        try:
+            os.posix_fallocate(self.fd, 0, self.size)
+        except (AttributeError, OSError):  # not supported by platform or file system: leave a sparse file instead
+            os.ftruncate(self.fd, self.size)
+        return []
+
+    def open_segment(self, start):
+        if hasattr(os, 'pwrite'):
+            writer = _SegmentWriter(self.fd, start)
+        else:
+            writer = _SeekingSegmentWriter(self.file_path, start)
+        self.writers.append(writer)
+        return writer
+
+    def save(self, key, segments):
+        """
+        record the downloaded ranges [(start, end), ...] under key. the data is synced first, as nothing else tells
+        which bytes of a preallocated file have reached the disk.
+        """
+        for w in list(self.writers):
+            if isinstance(w, _SeekingSegmentWriter):
+                try:
+                    w.f.flush()
+                except ValueError:  # closed, thus flushed
+                    pass
+        os.fsync(self.fd)
+        _write_journal(self.journal_path, key, segments)
+
+    def finish(self, final_path):
+        os.close(self.fd)
+        self.fd = None
+        return self.resumed + sum(w.written for w in self.writers)
+
+    def cleanup(self):
+        if exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+_MERGE_BUFFER_SIZE = 1024 * 1024  # bytes held in memory at a time when the kernel cannot copy for us
+
+# errors meaning a zero-copy syscall is not usable for this pair of files, so the next method should be tried.
+_ZERO_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK,
+                          getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+
+def _copy_file_range(in_fd, out_fd, offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, offset)
+
+
+def _sendfile(in_fd, out_fd, offset, count):
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+# sendfile only writes to a file on Linux; on macOS and the BSDs it needs a socket (ENOTSOCK).
+_zero_copy_methods = [m for m, name in [(_copy_file_range, 'copy_file_range'), (_sendfile, 'sendfile')]
+                      if hasattr(os, name) and (m is not _sendfile or sys.platform.startswith('linux'))]
+_zero_copy_lock = threading.Lock()  # several merges may run at once (see DownloadManager)
+
+
+def _append_file(src, dst):
+    """
+    append the whole content of src to dst (both unbuffered binary files) with bounded memory.
+    the kernel copies the data if copy_file_range or sendfile works on this platform & file system;
+    otherwise a fixed-size buffer is reused.
+    :return: the number of bytes copied.
+    """
+    size = os.fstat(src.fileno()).st_size
+    copied = 0
+    for method in list(_zero_copy_methods):
+        try:
+            while copied < size and (n := method(src.fileno(), dst.fileno(), copied, size - copied)) > 0:
+                copied += n
+        except OSError as e:
+            if copied != 0 or e.errno not in _ZERO_COPY_UNSUPPORTED:
+                raise
+            with _zero_copy_lock:  # do not try it again for the remaining debris
+                if method in _zero_copy_methods:
+                    _zero_copy_methods.remove(method)
+        if copied == size:
+            return copied
+
+    src.seek(copied)
+    buf = bytearray(_MERGE_BUFFER_SIZE)
+    view = memoryview(buf)
+    while (n := src.readinto(buf)) > 0:
+        written = 0
+        while written < n:
+            written += dst.write(view[written:n])
+        copied += n
+    return copied
+
+
+def _merge_debris(debris_dir, final_path):
+    debris_l = sorted((d for d in listdir(debris_dir) if d.isdigit()), key=int)  # skip the journal
+    if len(debris_l) == 1:  # nothing to merge: move the only debris if it is on the same file system
+        d = join(debris_dir, debris_l[0])
+        try:
+            total_len = os.stat(d).st_size
+            os.replace(d, final_path)
+            return total_len
+        except OSError:
+            pass
+    with open(final_path, 'wb', buffering=0) as final:
+        total_len = 0
+        for d in debris_l:
+            d = join(debris_dir, d)
+            with open(d, 'rb', buffering=0) as debris:
+                total_len += _append_file(debris, final)
+    return total_len
@@ -0,0 +1,37 @@
+#
+# Created on 2026/10/18.
+#
+# the modules are flat siblings that import each other by name, and the package is imported by the name of its folder.
+# run from the root of the repository: python -m pytest -q
+import importlib
+import os
+import sys
+from os.path import dirname, abspath, basename, join
+
+import pytest
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path[:0] = [ROOT, dirname(ROOT), join(ROOT, 'benchmarks')]
+
+
+@pytest.fixture(scope='session')
+def hsrequest():
+    return importlib.import_module(basename(ROOT))
+
+
+@pytest.fixture
+def range_server():
+    """
+    :return: f(data=None, **options of RangeServer) -> a RangeServer serving from a thread, stopped after the test.
+    """
+    from range_server import RangeServer
+    servers = []
+
+    def start(data=None, **options):
+        server = RangeServer(os.urandom(4 * 1024 * 1024) if data is None else data, **options).start_in_thread()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop_thread()
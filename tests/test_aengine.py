@@ -0,0 +1,22 @@
+#
+# Created on 2026/10/18.
+#
+import asyncio
+
+import aengine
+
+
+def test_download_follows_a_redirect_with_a_body(range_server, tmp_path):
+    server = range_server(redirects={'/old': '/file.bin', '/older': '/old'})
+    url = f'http://{server.host}:{server.port}/older'
+    size = asyncio.run(aengine.download(str(tmp_path / 'f.bin'), url, connections=4, timeout=10,
+                                        min_insertion_interval=1024 * 1024))
+    assert size == len(server.data)
+    assert (tmp_path / 'f.bin').read_bytes() == server.data
+
+
+def test_download_in_debris(range_server, tmp_path):
+    server = range_server()
+    asyncio.run(aengine.download(str(tmp_path / 'f.bin'), server.url, connections=8, timeout=10, direct_write=False,
+                                 debris_root=str(tmp_path / 'debris'), min_insertion_interval=256 * 1024))
+    assert (tmp_path / 'f.bin').read_bytes() == server.data
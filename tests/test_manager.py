@@ -0,0 +1,78 @@
+#
+# Created on 2026/10/18.
+#
+import threading
+
+import pytest
+
+from observer import ProgressObserver
+
+
+class _RaisingObserver(ProgressObserver):
+    def __init__(self, after=20):
+        self.calls = 0
+        self.after = after
+
+    def progress(self, label, n):
+        self.calls += 1
+        if self.calls == self.after:
+            raise RuntimeError('observer broke')
+
+
+def _run(target, timeout=60):
+    result = {}
+
+    def run():
+        try:
+            result['value'] = target()
+        except Exception as e:
+            result['error'] = e
+
+    th = threading.Thread(target=run, daemon=True)
+    th.start()
+    th.join(timeout)
+    assert not th.is_alive(), 'hangs'
+    return result
+
+
+def test_manager_ends_a_job_whose_segment_raises(hsrequest, range_server, tmp_path):
+    server = range_server(per_connection=16 * 1024 * 1024)
+    manager = hsrequest.DownloadManager(max_connections=8, per_host=8, debris_root=str(tmp_path / 'debris'),
+                                        min_insertion_interval=1024 * 1024)
+    bad = manager.add(str(tmp_path / 'bad.bin'), server.url, observer=_RaisingObserver())
+    good = manager.add(str(tmp_path / 'good.bin'), server.url)
+    _run(manager.run)
+    assert bad.state == good.state == 'done'
+    assert isinstance(bad.error, RuntimeError)
+    assert good.error is None
+    assert (tmp_path / 'good.bin').read_bytes() == server.data
+
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_download_raises_the_error_of_a_segment(hsrequest, range_server, tmp_path, adaptive):
+    server = range_server(per_connection=16 * 1024 * 1024)
+    result = _run(lambda: hsrequest.download_with_progress(
+        str(tmp_path / 'f.bin'), server.url, thread_count=8, observer=_RaisingObserver(), adaptive=adaptive,
+        debris_root=str(tmp_path / 'debris'), min_insertion_interval=1024 * 1024))
+    assert isinstance(result.get('error'), RuntimeError)
+
+
+def test_manager_rejects_bad_options(hsrequest, range_server, tmp_path):
+    with pytest.raises(ValueError):
+        hsrequest.DownloadManager(split_policy='bogus')
+    manager = hsrequest.DownloadManager()
+    with pytest.raises(ValueError):
+        manager.add(str(tmp_path / 'f.bin'), 'http://127.0.0.1/', split_policy='bogus')
+    with pytest.raises(TypeError):
+        manager.add(str(tmp_path / 'f.bin'), 'http://127.0.0.1/', bogus=1)
+    assert manager.jobs == []
+
+
+def test_manager_ends_a_job_that_fails_to_start(hsrequest, range_server, tmp_path):
+    server = range_server()
+    manager = hsrequest.DownloadManager(debris_root=str(tmp_path / 'debris'))
+    bad = manager.add(str(tmp_path / 'bad.bin'), server.url, rate_limit='fast')  # raises in _start
+    good = manager.add(str(tmp_path / 'good.bin'), server.url)
+    _run(manager.run)
+    assert bad.error is not None and good.error is None
+    assert (tmp_path / 'good.bin').read_bytes() == server.data
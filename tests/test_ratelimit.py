@@ -0,0 +1,104 @@
+#
+# Created on 2026/10/18.
+#
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket, Lease
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    a fake monotonic clock for ratelimit, moved on by clock.t += seconds. sleeping moves it on and is recorded.
+    """
+    class Clock:
+        t = 1000.0
+        sleeps = []
+
+    def sleep(seconds):
+        Clock.sleeps.append(seconds)
+        Clock.t += seconds
+
+    Clock.sleeps = []
+    monkeypatch.setattr(ratelimit, 'monotonic', lambda: Clock.t)
+    monkeypatch.setattr(ratelimit, 'sleep', sleep)
+    return Clock
+
+
+def test_set_keeps_what_is_not_given():
+    bucket = TokenBucket(1000, 5000)
+    bucket.set(burst=10000)
+    assert (bucket.rate, bucket.burst) == (1000, 10000)
+    bucket.set(2000)
+    assert (bucket.rate, bucket.burst) == (2000, 10000)
+
+
+def test_default_burst_follows_rate():
+    bucket = TokenBucket(1000)
+    assert bucket.burst == 1000
+    bucket.set(4000)
+    assert bucket.burst == 4000
+    bucket.set(burst=500)
+    bucket.set(8000)
+    assert bucket.burst == 500
+    bucket.set(burst=None)
+    assert bucket.burst == 8000
+
+
+def test_none_is_unlimited():
+    bucket = TokenBucket(1000)
+    bucket.set(None)
+    assert bucket.rate is None
+    assert bucket.take(10 ** 9) == 0
+
+
+@pytest.mark.parametrize('rate', [0, -1])
+def test_rate_must_be_positive(hsrequest, rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate)
+    with pytest.raises(ValueError):
+        TokenBucket(1000).set(rate)
+    with pytest.raises(ValueError):
+        hsrequest._as_limiter(rate)
+
+
+def test_tokens_refill_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(1000, 2000)
+    assert bucket.take(2000) == 0  # starts full
+    assert bucket.take(500) == pytest.approx(0.5)  # in debt: wait until it would have been paid back
+    clock.t += 1
+    assert bucket.take(500) == 0
+    clock.t += 100
+    assert bucket.take(2500) == pytest.approx(0.5)  # no more than burst was kept
+
+
+def test_set_refills_at_the_old_rate(clock):
+    bucket = TokenBucket(1000, 10000)
+    bucket.take(10000)
+    clock.t += 2
+    bucket.set(100)
+    assert bucket.take(2000) == 0
+    assert bucket.take(100) == pytest.approx(1)
+
+
+def test_lease_takes_from_every_bucket_once_per_lease(clock):
+    a, b = TokenBucket(100000, 100000), TokenBucket(50000, 4000)
+    lease = Lease([a, None, b])
+    size = min(a.lease_size(), b.lease_size())
+    assert size == 1000
+    for _ in range(size // 10):
+        lease.consume(10)
+    assert lease.balance == 0 and clock.sleeps == []
+    assert (a.take(0), b.take(0)) == (0, 0)
+    assert (a._tokens, b._tokens) == (100000 - size, 4000 - size)
+    lease.consume(5000)  # more than a lease: taken whole, and slept for the slower bucket
+    assert lease.balance == 0
+    assert clock.sleeps == [pytest.approx(2000 / 50000)]
+
+
+def test_lease_without_limit_never_sleeps(clock):
+    lease = Lease([TokenBucket(), None])
+    for _ in range(100):
+        lease.consume(1 << 20)
+    assert clock.sleeps == []
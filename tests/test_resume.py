@@ -0,0 +1,75 @@
+#
+# Created on 2026/10/18.
+#
+import os
+
+import pytest
+
+import storage
+
+
+def _leave_journal(hsrequest, server, tmp_path, direct_write, etag, done, journal=None):
+    """
+    leave an interrupted download of server to tmp_path / 'f.bin' with done = [(start, end), ...] journaled, whose bytes
+    are all b'?' so that it shows what has been resumed. journal replaces the text of the journal if given.
+    :return: the keyword arguments of download_with_progress to resume it with.
+    """
+    kwargs = {'thread_count': 4, 'headless': True, 'direct_write': direct_write}
+    if direct_write:
+        with open(tmp_path / 'f.bin', 'wb') as f:
+            f.write(b'?' * len(server.data))
+        journal_path = str(tmp_path / 'f.bin.journal.json')
+    else:
+        kwargs['debris_root'] = str(tmp_path / 'debris')
+        os.makedirs(tmp_path / 'debris' / 'f')
+        for start, end in done:
+            (tmp_path / 'debris' / 'f' / f'{start}').write_bytes(b'?' * (end - start))
+        journal_path = str(tmp_path / 'debris' / 'f' / 'journal.json')
+    key = hsrequest._journal_key(server.url, len(server.data), (etag, None))
+    storage._write_journal(journal_path, key, done)
+    if journal is not None:
+        with open(journal_path, 'w') as f:
+            f.write(journal)
+    return kwargs
+
+
+@pytest.mark.parametrize('direct_write', [True, False])
+def test_resume_with_etag(hsrequest, range_server, tmp_path, direct_write):
+    server = range_server()
+    half = len(server.data) // 2
+    kwargs = _leave_journal(hsrequest, server, tmp_path, direct_write, server.etag, [(0, half)])
+    hsrequest.download_with_progress(str(tmp_path / 'f.bin'), server.url, **kwargs)
+    content = (tmp_path / 'f.bin').read_bytes()
+    assert content[:half] == b'?' * half  # resumed, not downloaded again
+    assert content[half:] == server.data[half:]
+    assert not os.path.exists(tmp_path / 'f.bin.journal.json') and not os.path.exists(tmp_path / 'debris' / 'f')
+
+
+@pytest.mark.parametrize('direct_write', [True, False])
+def test_no_resume_without_validators(hsrequest, range_server, tmp_path, direct_write):
+    server = range_server(etag=None)
+    kwargs = _leave_journal(hsrequest, server, tmp_path, direct_write, None, [(0, len(server.data) // 2)])
+    hsrequest.download_with_progress(str(tmp_path / 'f.bin'), server.url, **kwargs)
+    assert (tmp_path / 'f.bin').read_bytes() == server.data
+
+
+@pytest.mark.parametrize('direct_write', [True, False])
+def test_no_resume_of_another_version(hsrequest, range_server, tmp_path, direct_write):
+    server = range_server()
+    kwargs = _leave_journal(hsrequest, server, tmp_path, direct_write, '"older"', [(0, len(server.data) // 2)])
+    hsrequest.download_with_progress(str(tmp_path / 'f.bin'), server.url, **kwargs)
+    assert (tmp_path / 'f.bin').read_bytes() == server.data
+
+
+@pytest.mark.parametrize('direct_write', [True, False])
+def test_no_resume_of_a_torn_journal(hsrequest, range_server, tmp_path, direct_write):
+    server = range_server()
+    kwargs = _leave_journal(hsrequest, server, tmp_path, direct_write, server.etag, [(0, len(server.data) // 2)],
+                            journal='{"key": {"url": ')
+    hsrequest.download_with_progress(str(tmp_path / 'f.bin'), server.url, **kwargs)
+    assert (tmp_path / 'f.bin').read_bytes() == server.data
+
+
+def test_no_journal_key_without_validators(hsrequest):
+    assert hsrequest._journal_key('http://h/f', 10, (None, None)) is None
+    assert hsrequest._journal_key('http://h/f', 10, (None, 'Mon, 01 Jan 2024 00:00:00 GMT'))['size'] == 10
@@ -0,0 +1,155 @@
+#
+# Created on 2026/10/18.
+#
+import random
+from time import monotonic
+
+import pytest
+
+from segments import Segment, SegmentMap, SPLIT_POLICIES
+
+SIZE = 1 << 20
+
+
+def _random_map(rng, size=SIZE):
+    """
+    a progress as _Download keeps it: empty sentinels at 0 and size, and disjoint segments in between, some ongoing.
+    """
+    progress = SegmentMap()
+    progress.ins(Segment(size, size, False))
+    progress.ins(Segment(0, 0, False))
+    points = sorted(rng.sample(range(1, size), 2 * rng.randint(0, 12)))
+    for start, end in zip(points[::2], points[1::2]):
+        seg = Segment(start, end, rng.random() < 0.7)
+        if seg.ongoing and rng.random() < 0.7:
+            seg.t_start = monotonic() - rng.uniform(0.1, 10)
+        progress.ins(seg)
+    return progress
+
+
+def _gaps(progress):
+    return [(nxt.start - seg.end, seg) for seg, nxt in progress.pairs() if nxt.start > seg.end]
+
+
+def test_stop_at_follows_the_next_start():
+    progress = SegmentMap()
+    progress.ins(Segment(100, 100, False))
+    first = Segment(0, 0, True)
+    progress.ins(first)
+    assert first.stop_at == 100
+    middle = Segment(40, 40, True)
+    progress.ins(middle)
+    assert (first.stop_at, middle.stop_at) == (40, 100)
+    progress.remove(middle)
+    assert first.stop_at == 100 and middle.removed
+    assert len(progress) == 2
+
+
+def test_segments_sharing_a_start():
+    progress = SegmentMap()
+    empty, seg = Segment(10, 10, False), Segment(10, 10, True)
+    progress.ins(empty)
+    progress.ins(seg)
+    assert list(progress) == [empty, seg]  # placed after the segments starting at the same position
+    assert progress.get_prev(seg) is empty and empty.stop_at == 10
+    progress.remove(empty)
+    assert list(progress) == [seg]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_largest_gap_matches_a_scan(seed):
+    rng = random.Random(seed)
+    progress = _random_map(rng)
+    for _ in range(300):
+        gaps = _gaps(progress)
+        gap, seg = progress.largest_gap()
+        if not gaps:
+            assert (gap, seg) == (0, None)
+            break
+        assert gap == max(g for g, _ in gaps)
+        assert gap == progress.gap_after(seg)
+        # what a download does to progress: owners read on, threads start in gaps, empty segments are removed.
+        g, owner = rng.choice(gaps)
+        action = rng.random()
+        if action < 0.5:
+            owner.end += rng.randint(1, g)
+        elif action < 0.8:
+            start, end = sorted(owner.end + rng.randint(0, g - 1) for _ in range(2))
+            progress.ins(Segment(start, end, True))
+        else:
+            new = Segment(owner.end + g // 2, owner.end + g // 2, True)
+            progress.ins(new)
+            progress.remove(new)
+
+
+@pytest.mark.parametrize('name', sorted(SPLIT_POLICIES))
+@pytest.mark.parametrize('seed', range(50))
+def test_split_point_keeps_away_from_the_owner(name, seed):
+    rng = random.Random(seed)
+    progress = _random_map(rng)
+    interval = rng.choice([2, 1000, 20000, 100000])
+    pos = SPLIT_POLICIES[name](progress, interval)
+    gaps = _gaps(progress)
+    if pos == -2:
+        assert gaps == []
+        return
+    claimable = [seg for g, seg in gaps if not seg.ongoing or g > interval]
+    if pos == -1:
+        assert gaps and not claimable
+        return
+    seg = progress.find_le(pos)
+    nxt = progress.get_next(seg)
+    assert seg in claimable
+    if seg.ongoing:
+        assert seg.end + interval // 2 <= pos <= nxt.start - interval // 2
+    else:
+        assert pos == seg.end
+
+
+def _download(hsrequest, size=SIZE, **kwargs):
+    return hsrequest._Download('http://localhost/f', size, {}, 10, None, None, {},
+                               chunk_size=1000, min_insertion_interval=10000, **kwargs)
+
+
+def test_reserved_segments_stop_at_the_next_start(hsrequest):
+    download = _download(hsrequest)
+    with download.cond:
+        download.reserve([0, SIZE // 4, SIZE // 2, 3 * SIZE // 4])
+        segs = [download.claim() for _ in range(4)]
+    assert [seg.start for seg in segs] == [0, SIZE // 4, SIZE // 2, 3 * SIZE // 4]
+    assert [seg.stop_at for seg in segs] == [SIZE // 4, SIZE // 2, 3 * SIZE // 4, SIZE]
+    assert all(seg.ongoing and seg.end == seg.start for seg in segs)
+
+
+def test_claim_rejects_a_split_the_owner_has_reached(hsrequest):
+    owner = None
+    points = []
+
+    def policy(progress, min_insertion_interval):
+        # the owner reads on while the point is found: the first point is within a chunk of it by then.
+        pos = (owner.end + owner.stop_at) // 2
+        points.append(pos)
+        if len(points) == 1:
+            owner.end = pos - 1
+        return pos
+
+    download = _download(hsrequest, split_policy=policy)
+    with download.cond:
+        download.reserve([0])
+        owner = download.claim()
+        seg = download.claim()
+    assert len(points) == 2 and seg.start == points[1]
+    assert [s.start for s in download.progress] == [0, 0, points[1], SIZE]
+    assert owner.stop_at == seg.start
+    assert seg.start - owner.end >= download.max_chunk_size
+
+
+def test_claim_hands_out_nothing_after_a_failure(hsrequest):
+    download = _download(hsrequest)
+    with download.cond:
+        download.reserve([0, SIZE // 2])
+    download.fail(RuntimeError('boom'))
+    with download.cond:
+        assert download.claim() == -1
+    assert download.next_segment('0') is None
+    assert download.finished.is_set()
@@ -0,0 +1,101 @@
+#
+# Created on 2026/10/18.
+#
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from Speedometer import Speedometer, SpeedAggregator, process_speed
+
+
+def test_speed_is_fed_while_a_slow_segment_is_read(hsrequest, range_server, tmp_path):
+    # 16KiB reads at 200KB/s: tune_every reads would take over 2.5s
+    server = range_server(b'z' * 600000, per_connection=200000)
+    host = process_speed.child(urlsplit(server.url).netloc)
+    th = threading.Thread(target=hsrequest.download_with_progress, args=(str(tmp_path / 'f.bin'), server.url),
+                          kwargs={'thread_count': 1, 'headless': True, 'debris_root': str(tmp_path / 'debris'),
+                                  'chunk_size': 16384})
+    th.start()
+    time.sleep(1)
+    seen = host.total()
+    th.join()
+    assert 0 < seen < len(server.data)
+    assert host.total() == len(server.data)
+
+
+def _accepted_between(accepted, bucket_l, bucket_u):
+    return sum(v for b, v in accepted if bucket_l < b <= bucket_u)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_ring_buffer_matches_a_scan(seed):
+    rng = random.Random(seed)
+    sm = Speedometer(precision_ms=50, start_now=False, horizon_ms=2000)
+    accepted = []  # (bucket, value) kept by sm
+    t = 100000
+    for _ in range(500):
+        t += rng.choice([0, 1, 20, 50, 120, 900, 5000])
+        ts = t - rng.choice([0, 0, 0, 30, 400, 3000])  # late ones, some beyond the horizon
+        value = rng.randint(1, 1000)
+        last = sm._last
+        sm._add(value, ts)
+        if last is None or ts // 50 > last - sm._n:
+            accepted.append((ts // 50, value))
+        assert sm._total == sum(v for _, v in accepted)
+        oldest = sm._last - sm._n + 1
+        l = rng.randint(oldest, sm._last)
+        u = rng.randint(l, sm._last)
+        assert sm._get_value_between(l * 50, u * 50 + rng.randint(0, 49)) == _accepted_between(accepted, l, u)
+    assert len(sm._cums) == 2000 // 50 + 1
+
+
+def test_cumulative_values_are_turned_into_increments():
+    sm = Speedometer(precision_ms=100, start_now=False)
+    sm._add(100, 1000, cumulative=True)
+    sm._add(250, 1200, cumulative=True)
+    sm._add(400, 1500, cumulative=True)
+    assert sm._total == 400
+    assert sm._get_value_between(1000, 1200) == 150
+
+
+def test_values_beyond_the_horizon_are_only_kept_in_the_sum():
+    sm = Speedometer(precision_ms=100, start_now=False, horizon_ms=1000)
+    sm._add(5, 0)
+    sm._add(7, 10 ** 6)
+    sm._add(11, 10 ** 6 - 2000)  # too late to be counted in a bucket
+    assert sm._total == 12
+    assert sm._get_value_between(10 ** 6 - 1000, 10 ** 6) == 7
+    assert sm._get_value_between(0, 10 ** 6) == 7  # the start is clamped to the horizon
+
+
+def test_cur_speed():
+    sm = Speedometer()
+    time.sleep(0.2)
+    sm.submit(2000)
+    assert 0 < sm.cur_speed(1000) <= 2000 / 200  # v/ms over the time it has run
+
+
+def test_aggregator_passes_values_up():
+    root = SpeedAggregator(precision_ms=50)
+    host = root.child('h')
+    assert root.child('h') is host and root.children() == {'h': host}
+    downloads = [SpeedAggregator(host, 50) for _ in range(4)]
+
+    def submit(sm):
+        for _ in range(1000):
+            sm.submit(3)
+
+    threads = [threading.Thread(target=submit, args=(sm,)) for sm in downloads]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert [sm.total() for sm in downloads] == [3000] * 4
+    assert host.total() == root.total() == 12000
+    with pytest.raises(ValueError):
+        host.submit(1, cumulative=True)
+    with pytest.raises(RuntimeError):
+        root.pause()
@@ -0,0 +1,140 @@
+#
+# Created on 2026/10/18.
+#
+import errno
+import json
+import os
+import threading
+
+import pytest
+
+import storage
+
+
+@pytest.mark.parametrize('code', [errno.ENOTSOCK, errno.EXDEV, errno.ENOSYS])
+def test_append_file_falls_back_to_copying(tmp_path, monkeypatch, code):
+    def unsupported(in_fd, out_fd, offset, count):
+        raise OSError(code, 'unsupported')
+
+    monkeypatch.setattr(storage, '_zero_copy_methods', [unsupported])
+    (tmp_path / 'src').write_bytes(b'x' * 3000)
+    with open(tmp_path / 'src', 'rb', buffering=0) as src, open(tmp_path / 'dst', 'wb', buffering=0) as dst:
+        assert storage._append_file(src, dst) == 3000
+    assert (tmp_path / 'dst').read_bytes() == b'x' * 3000
+    assert storage._zero_copy_methods == []
+
+
+def test_concurrent_merges_drop_a_method_once(tmp_path, monkeypatch):
+    barrier = threading.Barrier(8)
+
+    def unsupported(in_fd, out_fd, offset, count):
+        barrier.wait()
+        raise OSError(errno.EXDEV, 'cross-device')
+
+    monkeypatch.setattr(storage, '_zero_copy_methods', [unsupported])
+    (tmp_path / 'src').write_bytes(b'y' * 1000)
+    errors = []
+
+    def merge(i):
+        try:
+            with open(tmp_path / 'src', 'rb', buffering=0) as src, \
+                    open(tmp_path / f'dst{i}', 'wb', buffering=0) as dst:
+                storage._append_file(src, dst)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=merge, args=(i,)) for i in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert errors == []
+
+
+KEY = {'url': 'http://h/f', 'size': 1000, 'etag': '"v1"', 'last_modified': None}
+
+
+def _interrupted(kind, tmp_path, done, journal):
+    """
+    :return: the storage of a download of 1000 bytes left by an earlier run that has written b'?' over done, with the
+    journal text given.
+    """
+    if kind == 'debris':
+        storage_ = storage.DebrisStorage(str(tmp_path / 'debris'))
+        os.makedirs(storage_.debris_dir)
+        for start, end in done:
+            (tmp_path / 'debris' / f'{start}').write_bytes(b'?' * (end - start))
+    else:
+        storage_ = storage.DirectStorage(str(tmp_path / 'f.bin'), 1000)
+        content = bytearray(1000)
+        for start, end in done:
+            content[start:end] = b'?' * (end - start)
+        (tmp_path / 'f.bin').write_bytes(content)
+    with open(storage_.journal_path, 'w') as f:
+        f.write(journal)
+    return storage_
+
+
+def _kept(kind, tmp_path):
+    if kind == 'debris':
+        return sorted(os.listdir(tmp_path / 'debris'))
+    return (tmp_path / 'f.bin').read_bytes().count(b'?')
+
+
+@pytest.mark.parametrize('kind', ['debris', 'direct'])
+def test_journal_of_the_same_key_is_resumed(tmp_path, kind):
+    done = [(0, 300), (500, 600)]
+    storage_ = _interrupted(kind, tmp_path, done, json.dumps({'key': KEY, 'segments': done}))
+    assert storage_.prepare(KEY) == done
+    assert _kept(kind, tmp_path) == (['0', '500', 'journal.json'] if kind == 'debris' else 400)
+    storage_.finish(str(tmp_path / 'final.bin'))
+
+
+@pytest.mark.parametrize('kind', ['debris', 'direct'])
+@pytest.mark.parametrize('journal', [
+    '{"key": {"url": "http://h/f", "size": 1000, "etag": "\\"v1\\"", "last_mo',  # torn
+    '',
+    json.dumps({'key': {**KEY, 'etag': '"v2"'}, 'segments': [[0, 300]]}),  # changed on the server
+    json.dumps({'key': KEY}),
+    json.dumps({'key': KEY, 'segments': [[0]]}),
+])
+def test_invalid_journal_starts_over(tmp_path, kind, journal):
+    storage_ = _interrupted(kind, tmp_path, [(0, 300)], journal)
+    assert storage_.prepare(KEY) == []
+    assert _kept(kind, tmp_path) == ([] if kind == 'debris' else 0)
+    storage_.finish(str(tmp_path / 'final.bin'))
+
+
+@pytest.mark.parametrize('kind', ['debris', 'direct'])
+def test_no_key_starts_over(tmp_path, kind):
+    done = [(0, 300)]
+    storage_ = _interrupted(kind, tmp_path, done, json.dumps({'key': None, 'segments': done}))
+    assert storage_.prepare(None) == []
+    storage_.finish(str(tmp_path / 'final.bin'))
+
+
+def test_direct_file_of_another_size_starts_over(tmp_path):
+    done = [(0, 300)]
+    storage_ = _interrupted('direct', tmp_path, done, json.dumps({'key': KEY, 'segments': done}))
+    with open(tmp_path / 'f.bin', 'ab') as f:
+        f.write(b'!')
+    assert storage_.prepare(KEY) == []
+    assert os.path.getsize(tmp_path / 'f.bin') == 1000 and _kept('direct', tmp_path) == 0
+    storage_.finish(str(tmp_path / 'final.bin'))
+
+
+def test_debris_are_cut_to_the_journal(tmp_path):
+    storage_ = _interrupted('debris', tmp_path, [(0, 300), (500, 600), (800, 801)],
+                            json.dumps({'key': KEY, 'segments': [[0, 200], [500, 700], [900, 1000]]}))
+    # 0 was written on after the journal, 500 was still buffered, 800 was not recorded and 900 never reached the disk
+    assert storage_.prepare(KEY) == [(0, 200), (500, 600)]
+    assert _kept('debris', tmp_path) == ['0', '500', 'journal.json']
+    assert (tmp_path / 'debris' / '0').read_bytes() == b'?' * 200
+
+
+def test_journal_is_replaced_whole(tmp_path):
+    path = str(tmp_path / 'journal.json')
+    storage._write_journal(path, KEY, [(0, 10)])
+    storage._write_journal(path, KEY, [(0, 20)])
+    assert storage._read_journal(path, KEY) == [(0, 20)]
+    assert os.listdir(tmp_path) == ['journal.json']
@@ -0,0 +1,41 @@
+#
+# Created on 2026/10/18.
+#
+from collections import Counter
+
+from tuning import ConnectionController
+
+
+def _run(controller, throughput, updates):
+    """
+    :param throughput: f(connections) -> aggregate bytes/s of the emulated link.
+    :return: the connection counts after each update.
+    """
+    return [controller.update(throughput(controller.count)) for _ in range(updates)]
+
+
+def test_grows_to_the_capacity_of_the_link():
+    counts = _run(ConnectionController(initial=4, maximum=32), lambda n: min(n, 12) * 1e6, 300)
+    assert counts[:12] == [4, 4, 4, 8, 8, 8, 8, 16, 16, 16, 16, 32]  # settle, then doubling steps
+    later = Counter(counts[-100:])
+    assert set(later) <= set(range(9, 14))  # probes of one more, or a quarter less
+    assert later.most_common(1)[0][0] == 12
+
+
+def test_retires_connections_a_throttled_server_does_not_reward():
+    counts = _run(ConnectionController(initial=4, maximum=32), lambda n: 5e6, 300)
+    assert set(counts[-100:]) <= {1, 2}
+
+
+def test_follows_a_capacity_that_changes():
+    controller = ConnectionController(initial=4, maximum=32)
+    _run(controller, lambda n: min(n, 8) * 1e6, 200)
+    counts = _run(controller, lambda n: min(n, 20) * 1e6, 300)
+    assert Counter(counts[-100:]).most_common(1)[0][0] >= 16
+
+
+def test_stays_within_limits():
+    counts = _run(ConnectionController(initial=40, maximum=32), lambda n: n * 1e6, 200)
+    assert counts[0] == 32 and max(counts) == 32
+    counts = _run(ConnectionController(initial=1, maximum=32), lambda n: 1e6 / n, 200)
+    assert min(counts) == 1
@@ -0,0 +1,133 @@
+#
+# Created on 2026/10/18.
+#
+# opt-in span tracing of the engine, saved in the Chrome trace event format (chrome://tracing, ui.perfetto.dev).
+# disabled unless start() has been called: span() then returns a shared no-op span, and traced() the function itself,
+# so the chunk loop runs exactly the same code as without tracing.
+import json
+import os
+import threading
+from time import perf_counter_ns
+from typing import Optional
+
+
+class Tracer:
+    """
+    collects complete ('X') events from any thread. list.append is atomic, so no lock is taken per event.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.events = []
+        self.pid = os.getpid()
+        self.thread_names = {}  # tid: name
+        self._t0 = perf_counter_ns()
+
+    def add(self, name, cat, start_ns, end_ns, args=None):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                 'ts': (start_ns - self._t0) / 1000, 'dur': (end_ns - start_ns) / 1000}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def to_json(self):
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in list(self.thread_names.items())]
+        return {'traceEvents': names + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save(self, path=None):
+        with open(path or self.path, 'w') as f:
+            json.dump(self.to_json(), f)
+
+
+tracer: Optional[Tracer] = None
+
+
+def start(path=None):
+    """
+    start tracing all downloads of the process.
+    :param path: file that stop() writes the trace to.
+    """
+    global tracer
+    tracer = Tracer(path)
+    return tracer
+
+
+def stop():
+    """
+    stop tracing, and write the trace to the path given to start(), if any.
+    :return: the Tracer, or None if not tracing.
+    """
+    global tracer
+    t, tracer = tracer, None
+    if t is not None and t.path is not None:
+        t.save()
+    return t
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start_ns')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_ns = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.add(self.name, self.cat, self.start_ns, perf_counter_ns(), self.args)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, cat='engine', **args):
+    """
+    :return: a context manager that records the time spent in it as one event; args can be added with its set().
+    """
+    t = tracer
+    return _NULL_SPAN if t is None else _Span(t, name, cat, args)
+
+
+def traced(func, name, cat='engine'):
+    """
+    :return: func itself if not tracing, else a wrapper recording every call as one event.
+    bind it once outside of a loop, so that the loop costs nothing when tracing is off.
+    """
+    t = tracer
+    if t is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        start_ns = perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            t.add(name, cat, start_ns, perf_counter_ns())
+
+    return wrapper
@@ -0,0 +1,120 @@
+#
+# Created on 2026/10/18.
+#
+
+
+class AutoTuner:
+    """
+    derives chunk_size and min_insertion_interval of one download from the measured time to first byte (ttfb) of its
+    requests and the throughput of a single connection, both smoothed by an exponential moving average.
+    chunk_size: one read should take about read_time, so that the per-chunk cost of the python loop is amortised on
+    fast links, while a slow link still checks its boundary and reports progress often.
+    min_insertion_interval: a new segment leaves its connection idle for about one ttfb, so the smallest split should
+    take split_cost_ratio times as long to download.
+    observations come from many threads without a lock: a sample lost in a race only delays the tuning a little.
+    """
+
+    def __init__(self, chunk_size, min_insertion_interval, read_time=0.005, split_cost_ratio=20, alpha=0.2,
+                 chunk_range=(16384, 1048576), split_range=(262144, 268435456)):
+        """
+        :param chunk_size: used until a throughput is measured.
+        :param min_insertion_interval: used until both ttfb and throughput are measured.
+        """
+        self.chunk_size = chunk_size
+        self.min_insertion_interval = min_insertion_interval
+        self.read_time = read_time
+        self.split_cost_ratio = split_cost_ratio
+        self.alpha = alpha
+        self.chunk_range = chunk_range
+        self.split_range = split_range
+        self.ttfb = None  # s
+        self.speed = None  # bytes/s of one connection
+
+    def _average(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    def observe_ttfb(self, t):
+        self.ttfb = self._average(self.ttfb, t)
+        self._tune()
+
+    def observe_speed(self, speed):
+        self.speed = self._average(self.speed, speed)
+        self._tune()
+
+    def _tune(self):
+        if self.speed is None:
+            return
+        lo, hi = self.chunk_range
+        self.chunk_size = min(max(int(self.speed * self.read_time) // 4096 * 4096, lo), hi)
+        if self.ttfb is not None:
+            lo, hi = self.split_range
+            self.min_insertion_interval = min(max(int(self.speed * self.ttfb * self.split_cost_ratio), lo), hi)
+
+
+class ConnectionController:
+    """
+    decides the number of connections of one download by hill climbing on its aggregate throughput.
+    growing: connections are added, doubling the step each time, while every addition still raises the throughput by
+    at least gain; the addition that does not is retired at once.
+    holding: every probe_every measurements, alternately one connection is added, or a quarter of them is retired if
+    that costs less than gain of the throughput (a server that throttles per IP gains nothing from more connections).
+    a successful addition resumes growing and a successful retirement is repeated, so the count follows a link or a
+    server whose capacity changes.
+    after each change, `settle` samples are skipped (handshakes, slow start) and the next `window` are averaged.
+    """
+
+    def __init__(self, initial=4, maximum=32, gain=0.1, settle=2, window=2, probe_every=10):
+        self.maximum = maximum
+        self.count = min(initial, maximum)
+        self.gain = gain
+        self.settle = settle
+        self.window = window
+        self.probe_every = probe_every
+        self._step = 0  # connections added (>0) or retired (<0) by the last change to be judged, or 0
+        self._base = None  # throughput before that change
+        self._samples = []
+        self._skip = settle
+        self._measurements = 0  # since the last change
+        self._probe_up = False  # direction of the next probe while holding
+
+    def _change(self, step, judged=True):
+        self._step = step if judged else 0
+        self.count += step
+        self._skip = self.settle
+        self._measurements = 0
+
+    def update(self, throughput):
+        """
+        :param throughput: aggregate bytes/s over the last interval.
+        :return: the number of connections to run from now on.
+        """
+        if self._skip:
+            self._skip -= 1
+            return self.count
+        self._samples.append(throughput)
+        if len(self._samples) < self.window:
+            return self.count
+        cur = sum(self._samples) / len(self._samples)
+        self._samples.clear()
+        self._measurements += 1
+
+        step = self._step
+        if step > 0 and cur < self._base * (1 + self.gain) or step < 0 and cur < self._base * (1 - self.gain):
+            self._change(-step, judged=False)  # undo; the throughput measured before it still stands
+            return self.count
+        first = self._base is None
+        self._base = cur
+        if first:  # start growing
+            step = min(self.count, self.maximum - self.count)
+        elif step > 0:  # keep growing
+            step = min(step * 2, self.maximum - self.count)
+        elif step < 0:  # keep retiring
+            step = max(step, 1 - self.count)
+        elif self._measurements >= self.probe_every:
+            self._probe_up = not self._probe_up
+            step = min(1, self.maximum - self.count) if self._probe_up else -min(self.count // 4, self.count - 1)
+        if step:
+            self._change(step)
+        else:
+            self._step = 0
+        return self.count
@@ -4,6 +4,10 @@
 import re
 from datetime import timedelta
 from os.path import split, splitext, join
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # only for the annotation: importing utils must not need Tk
+    from tkinter.ttk import Treeview
 
 __all__ = [
     'treeview_sort_column',
@@ -16,13 +20,14 @@ __all__ = [
     '_fmt_size',
 ]
 
-from tkinter import TclError
-
-from tkinter.ttk import Treeview
 
-
-def treeview_sort_column(tv: Treeview, col, reverse):
+def treeview_sort_column(tv: 'Treeview', col, reverse, before=None):
     # https://stackoverflow.com/questions/1966929/tk-treeview-column-sort
+    # before: called first, e.g. to bring the values up to date.
+    from tkinter import TclError  # not at the top: importing utils must not need Tk
+
+    if before is not None:
+        before()
     try:
         l = [(tv.set(k, col), k) for k in tv.get_children('')]
     except TclError:  # col is display column (i.e. "#0") if TclError raised
@@ -41,7 +46,7 @@ def treeview_sort_column(tv: Treeview, col, reverse):
         tv.move(k, '', index)
 
     # reverse sort next time
-    tv.heading(col, command=lambda _col=col: treeview_sort_column(tv, _col, not reverse))
+    tv.heading(col, command=lambda _col=col: treeview_sort_column(tv, _col, not reverse, before))
 
 
 def _get_name_no_ext(path):